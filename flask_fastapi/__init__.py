@@ -1,4 +1,13 @@
 from .flask_fastapi import FlaskFastAPI
+from .auth import Authenticated, CredentialCache
+from .background import BackgroundTasks
+from .dependencies import Depends
+from .codec import Codec, CodecRegistry
+from .compression import Compression
+from .metrics import Metrics
+from .profiling import Profiler
+from .reporting import ExceptionDispatcher
+from .cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
 from .exceptions import (
     HttpException,
     ConflictException,
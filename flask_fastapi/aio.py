@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import Future
+
+from .utils import PerProcess
+
+import asyncio
+import contextvars
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopThread:
+    """An event loop, running in a background thread, shared by the process.
+
+    Coroutines from ``async def`` handlers and dependencies are run on it
+    rather than on a new loop for every request, so connection pools and
+    other loop bound resources can be reused between requests. Each worker
+    process gets its own loop.
+    """
+
+    def __init__(self):
+        self._process = PerProcess(self._start)
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+
+        threading.Thread(
+            target=loop.run_forever,
+            name="flask-fastapi-loop",
+            daemon=True,
+        ).start()
+
+        self._loop = loop
+
+    @property
+    def loop(self):
+        self._process.ensure()
+
+        return self._loop
+
+    def run(self, awaitable, timeout=None):
+        """Run ``awaitable`` on the loop and wait for its result.
+
+        It runs in a copy of the caller's context, so the request and app
+        contexts are still available to it.
+        """
+
+        loop = self.loop
+        context = contextvars.copy_context()
+        result = Future()
+
+        def done(task):
+            if task.cancelled():
+                result.cancel()
+
+            elif task.exception() is not None:
+                result.set_exception(task.exception())
+
+            else:
+                result.set_result(task.result())
+
+        def start():
+            task = loop.create_task(_await(awaitable), context=context)
+            task.add_done_callback(done)
+
+        loop.call_soon_threadsafe(start)
+
+        return result.result(timeout)
+
+
+async def _await(awaitable):
+    return await awaitable
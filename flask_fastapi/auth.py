@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, NamedTuple, Optional
+
+from .cache import LRUCache
+
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+_rejected = object()
+
+# the security schemes in the openapi document, and where their credentials
+# are sent
+BEARER_AUTH = "bearerAuth"
+API_KEY_AUTH = "apiKeyAuth"
+API_KEY_HEADER = "X-API-Key"
+
+
+class Authenticated(NamedTuple):
+    """What an authenticator returns for a credential it accepts.
+
+    ``expires`` is when the credential stops being valid, as a unix
+    timestamp (e.g. a JWT's ``exp``), so it isn't cached for any longer.
+    Authenticators can also return the principal on its own.
+    """
+
+    principal: Any
+    expires: Optional[float] = None
+
+
+def request_credential(scheme, headers):
+    """The credential for ``scheme`` sent with a request, or ``None``."""
+
+    if scheme == BEARER_AUTH:
+        kind, _, token = headers.get("Authorization", "").partition(" ")
+
+        if kind.lower() == "bearer" and token.strip():
+            return token.strip()
+
+        return None
+
+    if scheme == API_KEY_AUTH:
+        return headers.get(API_KEY_HEADER) or None
+
+    raise ValueError("unknown security scheme %s" % scheme)
+
+
+def challenge(schemes):
+    """``WWW-Authenticate`` value listing the schemes that are accepted."""
+
+    challenges = []
+
+    if BEARER_AUTH in schemes:
+        challenges.append("Bearer")
+
+    if API_KEY_AUTH in schemes:
+        # not a registered scheme, but commonly used for api keys
+        challenges.append('ApiKey header="%s"' % API_KEY_HEADER)
+
+    return ", ".join(challenges)
+
+
+class CredentialCache:
+    """Remembers the outcome of verifying credentials.
+
+    Accepted credentials are kept for ``ttl`` seconds, or until they expire
+    if that's sooner, and rejected ones for ``negative_ttl`` seconds.
+    Entries are keyed on a hash of the credential, the credential itself is
+    never kept.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=5, max_entries=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = LRUCache(maxsize=max_entries)
+
+    def _key(self, scheme, credential):
+        return scheme, hashlib.sha256(credential.encode("utf-8")).digest()
+
+    def verify(self, scheme, credential, authenticator):
+        """The principal for ``credential``, or ``None`` if it's rejected."""
+
+        key = self._key(scheme, credential)
+        now = time.time()
+        entry = self._cache.get(key)
+
+        if entry is not None:
+            principal, expires = entry
+
+            if expires > now:
+                return None if principal is _rejected else principal
+
+            self._cache.delete(key)
+
+        result = authenticator(credential)
+        expires = None
+
+        if isinstance(result, Authenticated):
+            result, expires = result
+
+        if expires is not None and expires <= now:
+            # accepted, but already expired
+            result = None
+
+        if result is None:
+            self._cache.set(key, (_rejected, now + self.negative_ttl))
+
+            return None
+
+        expires = now + self.ttl if expires is None else min(expires, now + self.ttl)
+        self._cache.set(key, (result, expires))
+
+        return result
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
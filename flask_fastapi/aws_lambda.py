@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+from urllib.parse import urlencode
+
+import base64
+import io
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# bodies of these types are returned as text, everything else as base64
+_text_mimetypes = (
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/x-yaml",
+    "application/xml",
+)
+
+
+def _is_text(mimetype):
+    return (
+        mimetype.startswith("text/")
+        or mimetype in _text_mimetypes
+        or mimetype.endswith(("+json", "+xml"))
+    )
+
+
+def _event_headers(event):
+    """Headers from an event as a list of (name, value) pairs."""
+
+    multi = event.get("multiValueHeaders")
+
+    if multi:
+        return [(name, value) for name, values in multi.items() for value in values]
+
+    headers = list((event.get("headers") or {}).items())
+
+    # api gateway v2 moves cookies out of the headers
+    if event.get("cookies"):
+        headers.append(("cookie", "; ".join(event["cookies"])))
+
+    return headers
+
+
+def _event_query_string(event, is_alb):
+    if "rawQueryString" in event:
+        return event["rawQueryString"]
+
+    multi = event.get("multiValueQueryStringParameters")
+
+    if multi:
+        pairs = [(name, value) for name, values in multi.items() for value in values]
+
+    else:
+        pairs = list((event.get("queryStringParameters") or {}).items())
+
+    if is_alb:
+        # the load balancer passes the values through still url encoded
+        return "&".join("%s=%s" % pair for pair in pairs)
+
+    return urlencode(pairs)
+
+
+def event_to_environ(event, context=None):
+    """Build a WSGI environ straight from an API Gateway or ALB event."""
+
+    request_context = event.get("requestContext") or {}
+    is_alb = "elb" in request_context
+
+    if event.get("version") == "2.0":
+        method = request_context["http"]["method"]
+        path = event.get("rawPath") or "/"
+
+    else:
+        method = event["httpMethod"]
+        path = event.get("path") or "/"
+
+    body = event.get("body") or b""
+
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+
+    environ = {
+        "REQUEST_METHOD": method.upper(),
+        "SCRIPT_NAME": "",
+        # wsgi strings are latin-1 decoded bytes
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": _event_query_string(event, is_alb),
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "SERVER_NAME": "lambda",
+        "SERVER_PORT": "443",
+        "REMOTE_ADDR": "127.0.0.1",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "https",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "aws.event": event,
+        "aws.context": context,
+    }
+
+    for name, value in _event_headers(event):
+        key = name.upper().replace("-", "_")
+
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+
+        elif key == "CONTENT_LENGTH":
+            continue
+
+        elif key == "HOST":
+            environ["HTTP_HOST"] = environ["SERVER_NAME"] = value.split(":")[0]
+
+        elif key == "X_FORWARDED_PROTO":
+            environ["HTTP_X_FORWARDED_PROTO"] = environ["wsgi.url_scheme"] = value
+
+        elif key == "X_FORWARDED_PORT":
+            environ["HTTP_X_FORWARDED_PORT"] = environ["SERVER_PORT"] = value
+
+        else:
+            key = "HTTP_" + key
+
+            # repeated headers are joined, as a wsgi server would
+            if key in environ:
+                environ[key] += "," + value
+
+            else:
+                environ[key] = value
+
+    source_ip = request_context.get("identity", {}).get("sourceIp") or (
+        request_context.get("http", {}).get("sourceIp")
+    )
+
+    if source_ip:
+        environ["REMOTE_ADDR"] = source_ip
+
+    return environ
+
+
+def response_to_result(response, event):
+    """Turn a Flask response into the result dict Lambda expects."""
+
+    try:
+        # a single bytes chunk is joined without a copy
+        body = b"".join(response.iter_encoded())
+
+    finally:
+        response.close()
+
+    result = {
+        "statusCode": response.status_code,
+    }
+
+    if _is_text(response.mimetype or "") and "Content-Encoding" not in response.headers:
+        result["body"] = body.decode("utf-8")
+        result["isBase64Encoded"] = False
+
+    else:
+        result["body"] = base64.b64encode(body).decode("ascii")
+        result["isBase64Encoded"] = True
+
+    headers = response.headers
+
+    if event.get("version") == "2.0":
+        result["cookies"] = headers.getlist("Set-Cookie")
+        result["headers"] = {
+            name: ", ".join(headers.getlist(name))
+            for name in dict.fromkeys(key for key, _ in headers.items())
+            if name.lower() != "set-cookie"
+        }
+
+    elif "multiValueHeaders" in event:
+        result["multiValueHeaders"] = {
+            name: headers.getlist(name)
+            for name in dict.fromkeys(key for key, _ in headers.items())
+        }
+
+    else:
+        result["headers"] = dict(headers.items())
+
+    if "elb" in (event.get("requestContext") or {}):
+        result["statusDescription"] = "%d %s" % (
+            response.status_code,
+            response.status.split(" ", 1)[-1],
+        )
+
+    return result
+
+
+def handle_event(app, event, context=None):
+    """Dispatch an API Gateway (v1 or v2) or ALB event through ``app``.
+
+    The request goes straight into the url map and view, there is no WSGI
+    server in between.
+    """
+
+    ctx = app.request_context(event_to_environ(event, context))
+    error = None
+
+    try:
+        try:
+            ctx.push()
+            response = app.full_dispatch_request()
+
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+
+        return response_to_result(response, event)
+
+    finally:
+        ctx.pop(error)
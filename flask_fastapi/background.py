@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .utils import PerProcess
+
+import inspect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """Work for a handler to do once its response has been sent.
+
+    Declare a parameter annotated with ``BackgroundTasks`` and an instance is
+    passed in. Tasks only run if the handler returns normally.
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, func, *args, **kwargs):
+        self.tasks.append((func, args, kwargs))
+
+    def __len__(self):
+        return len(self.tasks)
+
+
+class BackgroundExecutor:
+    """Runs background tasks on a pool of at most ``max_workers`` threads.
+
+    A request's tasks run one after the other, in the order they were
+    added, while different requests' tasks run concurrently. Tasks that
+    raise are passed to the app's exception reporters, and don't stop the
+    ones after them.
+    """
+
+    def __init__(self, app, max_workers=4):
+        self.app = app
+        self.max_workers = max_workers
+
+        self._process = PerProcess(self._start)
+
+    def _start(self):
+        # tasks submitted before a fork are the parent's
+        self._pool = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix="flask-fastapi-task"
+        )
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        self._process.ensure()
+
+        return self._pool
+
+    def _run(self, tasks):
+        with self.app.app_context():
+            for func, args, kwargs in tasks:
+                try:
+                    result = func(*args, **kwargs)
+
+                    if inspect.isawaitable(result):
+                        # async def tasks run on the app's event loop
+                        self.app.event_loop.run(result)
+
+                except Exception as e:
+                    logger.exception("background task %r failed", func)
+                    self.app._report_exception(e)
+
+    def submit(self, tasks: BackgroundTasks):
+        if not tasks.tasks:
+            return
+
+        future = self._executor().submit(self._run, list(tasks.tasks))
+
+        with self._lock:
+            self._pending.add(future)
+
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def drain(self, timeout=None):
+        """Wait for submitted tasks to finish, ``False`` on timeout."""
+
+        if not self._process.started:
+            return True
+
+        with self._lock:
+            pending = list(self._pending)
+
+        _, not_done = wait(pending, timeout)
+
+        return not not_done
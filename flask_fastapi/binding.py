@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+from inspect import Parameter, signature
+from pydantic import TypeAdapter
+from pydantic.fields import FieldInfo
+from pydantic_core import PydanticUndefined
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    get_args,
+    get_origin,
+)
+
+from typing_extensions import NotRequired, Required, TypedDict
+
+from .background import BackgroundTasks
+from .constants import ParamSource
+from .dependencies import (
+    ARGUMENT_BACKGROUND,
+    ARGUMENT_DEPENDENCY,
+    ARGUMENT_PARAM,
+    ARGUMENT_PRINCIPAL,
+    DependencyNode,
+    DependencyPlan,
+    Depends,
+)
+from .streaming import stream_item_type, validate_stream
+
+import collections.abc
+import inspect
+import logging
+import re
+import types
+
+logger = logging.getLogger(__name__)
+
+# used to mark a binding that has no default value
+Undefined = PydanticUndefined
+
+_rule_argument_re = re.compile(r"<(?:[^<>:]+:)?(\w+)>")
+
+_union_origins = (Union, types.UnionType)
+_multi_origins = (
+    list,
+    tuple,
+    set,
+    frozenset,
+    collections.abc.Sequence,
+    collections.abc.Set,
+)
+
+
+class ParamBinding(NamedTuple):
+    """How a single handler parameter is populated from the request.
+
+    Bindings are compiled once by ``FlaskFastAPI.route()`` so that the per
+    request work is limited to looking up the raw value and running
+    ``coerce`` over it. Path and query values are then validated together,
+    see ``compile_params_adapter``.
+    """
+
+    name: str
+    source: ParamSource
+    coerce: Optional[Callable[[Any], Any]]
+    default: Any
+    default_factory: Optional[Callable[[], Any]]
+    required: bool
+    stream: bool = False
+    adapter: Optional[TypeAdapter] = None
+    # the query argument's name, when it differs from the parameter's
+    alias: Optional[str] = None
+
+
+def rule_arguments(rule: str) -> Tuple[str, ...]:
+    return tuple(_rule_argument_re.findall(rule))
+
+
+def _is_multi(annotation):
+    # Optional[List[int]] and friends still take every value given
+    origin = get_origin(annotation)
+
+    if origin in _union_origins:
+        return any(_is_multi(arg) for arg in get_args(annotation))
+
+    return origin in _multi_origins or annotation in _multi_origins
+
+
+def _query_coercer(annotation):
+    # query args are always delivered as a list of values, validation and
+    # coercion happens afterwards for all parameters at once
+    if _is_multi(annotation):
+        return lambda values: values
+
+    return lambda values: values[0]
+
+
+def _stream_body_coercer(adapter):
+    def coerce(items):
+        return validate_stream(items, adapter)
+
+    return coerce
+
+
+def _resolve_default(param):
+    default = param.default
+    default_factory = None
+
+    if isinstance(default, FieldInfo):
+        default_factory = default.default_factory
+        default = default.default
+
+    if default is Parameter.empty or default is Ellipsis:
+        default = Undefined
+
+    required = default is Undefined and default_factory is None
+
+    return default, default_factory, required
+
+
+def compile_bindings(func_sig, rule: str) -> Tuple[ParamBinding, ...]:
+    path_arguments = rule_arguments(rule)
+    bindings = []
+
+    for name, param in func_sig.parameters.items():
+        if param.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD):
+            continue
+
+        default, default_factory, required = _resolve_default(param)
+        stream = False
+        adapter = None
+        alias = None
+
+        if isinstance(param.default, Depends):
+            # resolved by compile_dependencies, default is left as the marker
+            source = ParamSource.DEPENDENCY
+            coerce = None
+            required = False
+
+        elif name == "body":
+            # body is a keyword used for the request body
+            source = ParamSource.BODY
+            required = True
+            item_class = stream_item_type(param.annotation)
+
+            # the adapter is built once and reused for every request, which
+            # lets pydantic-core validate a whole List[Model] in one call
+            if item_class is not None:
+                # Iterator[Model] bodies are read and validated lazily
+                adapter = TypeAdapter(item_class)
+                coerce = _stream_body_coercer(adapter)
+                stream = True
+
+            else:
+                adapter = TypeAdapter(param.annotation)
+                coerce = adapter.validate_python
+
+        elif name == "principal":
+            # principal is a keyword for the authenticated caller
+            source = ParamSource.PRINCIPAL
+            coerce = None
+            required = False
+
+        elif param.annotation is BackgroundTasks:
+            # a fresh instance is passed in for each request
+            source = ParamSource.BACKGROUND
+            coerce = None
+            required = False
+
+        elif name in path_arguments:
+            # path arguments are already split out by the url map
+            source = ParamSource.PATH
+            coerce = None
+
+            assert not isinstance(param.default, FieldInfo) or not (
+                param.default.alias
+            ), ("path argument %s can't have an alias" % name)
+
+        else:
+            source = ParamSource.QUERY
+            coerce = _query_coercer(param.annotation)
+
+            if isinstance(param.default, FieldInfo) and param.default.alias:
+                alias = param.default.alias
+
+        bindings.append(
+            ParamBinding(
+                name=name,
+                source=source,
+                coerce=coerce,
+                default=default,
+                default_factory=default_factory,
+                required=required,
+                stream=stream,
+                adapter=adapter,
+                alias=alias,
+            )
+        )
+
+    return tuple(bindings)
+
+
+def compile_dependencies(bindings, rule: str):
+    """Resolve the graph of dependencies used by a handler's ``bindings``.
+
+    Returns the ``DependencyPlan``, or ``None`` when there are no
+    dependencies, along with the query and path bindings (and their
+    parameters) that the dependencies add.
+    """
+
+    nodes: List[DependencyNode] = []
+    cached: Dict[Tuple[Callable, str], int] = {}
+    param_bindings: Dict[str, ParamBinding] = {}
+    parameters: Dict[str, Parameter] = {}
+    background = False
+    principal = False
+
+    def add(depends, chain):
+        nonlocal background, principal
+
+        key = (depends.dependency, depends.scope)
+
+        if depends.use_cache and key in cached:
+            return cached[key]
+
+        assert depends.dependency not in chain, (
+            "circular dependency on %r" % depends.dependency
+        )
+
+        func_sig = signature(depends.dependency)
+        arguments = []
+
+        for binding in compile_bindings(func_sig, rule):
+            if binding.source == ParamSource.DEPENDENCY:
+                index = add(binding.default, chain + (depends.dependency,))
+                arguments.append((binding.name, ARGUMENT_DEPENDENCY, index))
+
+                assert (
+                    depends.scope == "request" or nodes[index].scope == "app"
+                ), "app scoped %r can't depend on request scoped %r" % (
+                    depends.dependency,
+                    nodes[index].func,
+                )
+
+                continue
+
+            assert depends.scope == "request", (
+                "app scoped %r can only depend on app scoped dependencies"
+                % depends.dependency
+            )
+            assert binding.source != ParamSource.BODY, (
+                "dependency %r can't use the request body" % depends.dependency
+            )
+
+            if binding.source == ParamSource.BACKGROUND:
+                arguments.append((binding.name, ARGUMENT_BACKGROUND, None))
+                background = True
+
+            elif binding.source == ParamSource.PRINCIPAL:
+                arguments.append((binding.name, ARGUMENT_PRINCIPAL, None))
+                principal = True
+
+            else:
+                arguments.append((binding.name, ARGUMENT_PARAM, binding.name))
+                param_bindings.setdefault(binding.name, binding)
+                parameters.setdefault(binding.name, func_sig.parameters[binding.name])
+
+        nodes.append(
+            DependencyNode(
+                func=depends.dependency,
+                scope=depends.scope,
+                generator=inspect.isgeneratorfunction(depends.dependency)
+                or inspect.isasyncgenfunction(depends.dependency),
+                is_async=inspect.iscoroutinefunction(depends.dependency)
+                or inspect.isasyncgenfunction(depends.dependency),
+                arguments=tuple(arguments),
+            )
+        )
+        index = len(nodes) - 1
+
+        if depends.use_cache:
+            cached[key] = index
+
+        return index
+
+    targets = tuple(
+        (binding.name, add(binding.default, ()))
+        for binding in bindings
+        if binding.source == ParamSource.DEPENDENCY
+    )
+
+    if not targets:
+        return None, (), {}
+
+    handler_params = {binding.name for binding in bindings}
+    plan = DependencyPlan(
+        nodes=tuple(nodes),
+        targets=targets,
+        private=tuple(name for name in param_bindings if name not in handler_params),
+        background=background,
+        principal=principal,
+    )
+
+    return plan, tuple(param_bindings.values()), parameters
+
+
+def compile_params_adapter(bindings, parameters) -> Optional[TypeAdapter]:
+    """Build one validator for every path and query parameter.
+
+    The parameters are described as a ``TypedDict`` so that pydantic-core can
+    validate them all in a single call, applying the type hints and any
+    ``Field`` constraints. Query parameters are keyed on their ``alias``, if
+    they have one, so that errors name the argument the client sent.
+    Defaults are left to ``bind_params``.
+    """
+
+    if not bindings:
+        return None
+
+    fields = {}
+
+    for binding in bindings:
+        param = parameters[binding.name]
+        annotation = param.annotation
+
+        if annotation is Parameter.empty:
+            annotation = Any
+
+        if isinstance(param.default, FieldInfo) and param.default.metadata:
+            annotation = Annotated[(annotation, *param.default.metadata)]
+
+        fields[binding.alias or binding.name] = (
+            Required[annotation] if binding.required else NotRequired[annotation]
+        )
+
+    # the functional form is the only one that takes fields not known until
+    # now, which mypy can't check
+    return TypeAdapter(TypedDict("Params", fields))  # type: ignore[operator]
+
+
+def bind_params(adapter, bindings, args, kwargs):
+    """Populate ``kwargs`` from the path arguments and query ``args``."""
+
+    raw = {}
+
+    for binding in bindings:
+        name = binding.name
+
+        if binding.source == ParamSource.PATH:
+            if name in kwargs:
+                raw[name] = kwargs[name]
+
+        else:
+            key = binding.alias or name
+            values = args.getlist(key)
+
+            if values:
+                raw[key] = binding.coerce(values)
+
+    # validation failure is raised back to the caller
+    kwargs.update(adapter.validate_python(raw))
+
+    for binding in bindings:
+        if binding.alias is not None and binding.alias in kwargs:
+            kwargs[binding.name] = kwargs.pop(binding.alias)
+
+        if binding.name not in kwargs:
+            if binding.default_factory is not None:
+                kwargs[binding.name] = binding.default_factory()
+
+            elif binding.default is not Undefined:
+                kwargs[binding.name] = binding.default
+
+    return kwargs
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import hashlib
+import logging
+import orjson
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+
+class LRUCache:
+    """A small thread-safe least recently used cache.
+
+    Tracks hits and misses so that callers can tell whether the cache is
+    sized correctly for their traffic.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _missing)
+
+            if value is _missing:
+                self.misses += 1
+
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    content_type: str
+    body: bytes
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per entry expiry."""
+
+    def __init__(self, max_entries=1024):
+        self._lru = LRUCache(maxsize=max_entries)
+
+    def get(self, key):
+        entry = self._lru.get(key)
+
+        if entry is None:
+            return None
+
+        expires, value = entry
+
+        if expires < time.monotonic():
+            self._lru.delete(key)
+
+            return None
+
+        return value
+
+    def set(self, key, value, ttl):
+        self._lru.set(key, (time.monotonic() + ttl, value))
+
+    def delete(self, key):
+        self._lru.delete(key)
+
+    def delete_prefix(self, prefix):
+        for key in self._lru.keys():
+            if key.startswith(prefix):
+                self._lru.delete(key)
+
+    def clear(self):
+        self._lru.clear()
+
+    def stats(self):
+        return self._lru.stats()
+
+
+class SQLiteCacheBackend:
+    """Cache stored in a SQLite database, shared by every worker on a host.
+
+    Each thread (and each forked worker) gets its own connection. The
+    database runs in WAL mode so that readers don't block each other.
+    """
+
+    def __init__(self, path, max_entries=10000, table="response_cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+
+    def _connection(self):
+        pid = os.getpid()
+
+        if getattr(self._local, "pid", None) != pid:
+            import sqlite3
+
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS %s ("
+                " key TEXT PRIMARY KEY,"
+                " expires REAL NOT NULL,"
+                " status INTEGER NOT NULL,"
+                " content_type TEXT NOT NULL,"
+                " body BLOB NOT NULL"
+                ")" % self.table
+            )
+
+            self._local.connection = connection
+            self._local.pid = pid
+
+        return self._local.connection
+
+    def get(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT status, content_type, body FROM %s"
+                " WHERE key = ? AND expires >= ?" % self.table,
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+
+        if row is None:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+
+        return CachedResponse(*row)
+
+    def set(self, key, value, ttl):
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute(
+            "INSERT OR REPLACE INTO %s (key, expires, status, content_type, body)"
+            " VALUES (?, ?, ?, ?, ?)" % self.table,
+            (key, now + ttl, value.status, value.content_type, value.body),
+        )
+
+        # evict expired entries, then whatever expires soonest, to stay
+        # within max_entries
+        connection.execute("DELETE FROM %s WHERE expires < ?" % self.table, (now,))
+        connection.execute(
+            "DELETE FROM %s WHERE key IN ("
+            " SELECT key FROM %s ORDER BY expires DESC LIMIT -1 OFFSET ?"
+            ")" % (self.table, self.table),
+            (self.max_entries,),
+        )
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM %s WHERE key = ?" % self.table, (key,))
+
+    def delete_prefix(self, prefix):
+        # not LIKE, endpoint names are full of underscores
+        self._connection().execute(
+            "DELETE FROM %s WHERE substr(key, 1, ?) = ?" % self.table,
+            (len(prefix), prefix),
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM %s" % self.table)
+
+    def stats(self):
+        (size,) = (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM %s" % self.table)
+            .fetchone()
+        )
+
+        return {
+            "size": size,
+            "maxsize": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def default_cache_key(kwargs):
+    return orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS, default=str)
+
+
+class ResponseCache:
+    """Server side cache of serialized responses for a route.
+
+    Pass an instance as ``cache=`` to ``FlaskFastAPI.route()``. Entries are
+    keyed on the endpoint, the negotiated codec and ``key(kwargs)``, where
+    ``kwargs`` are the validated path and query arguments, and live for
+    ``ttl`` seconds.
+
+    Variants of a response for the same arguments, e.g. for different
+    ``?fields=`` or callers, are keyed under the arguments' key so that
+    ``invalidate`` drops all of them. Backends need ``delete_prefix`` for
+    that.
+    """
+
+    def __init__(self, ttl, max_entries=1024, key=None, backend=None):
+        self.ttl = ttl
+        self.key = key or default_cache_key
+        self.backend = backend or MemoryCacheBackend(max_entries=max_entries)
+
+    def make_key(self, endpoint, mime_type, kwargs, variant=None):
+        key = self.key(kwargs)
+
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+
+        digest = hashlib.blake2b(key, digest_size=16).hexdigest()
+        key = "%s:%s:%s" % (endpoint, mime_type, digest)
+
+        if variant:
+            variant = default_cache_key(variant)
+            key += ":" + hashlib.blake2b(variant, digest_size=16).hexdigest()
+
+        return key
+
+    def invalidate_endpoint(self, endpoint):
+        """Drop every response for ``endpoint``, leaving other endpoints'."""
+
+        self.backend.delete_prefix(endpoint + ":")
+
+    def invalidate(self, endpoint, mime_type, kwargs):
+        """Drop the response for ``kwargs`` and every variant of it."""
+
+        key = self.make_key(endpoint, mime_type, kwargs)
+
+        self.backend.delete(key)
+        self.backend.delete_prefix(key + ":")
+
+    def get(self, key) -> Optional[CachedResponse]:
+        return self.backend.get(key)
+
+    def set(self, key, value: CachedResponse):
+        self.backend.set(key, value, self.ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
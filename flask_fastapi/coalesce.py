@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One in-flight execution that identical requests can wait on."""
+
+    def __init__(self):
+        self.done = False
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+        self._event = threading.Event()
+
+    def finish(self, result):
+        self.result = result
+        self.done = True
+        self._event.set()
+
+    def fail(self, error):
+        self.error = error
+        self.done = True
+        self._event.set()
+
+    def wait(self, timeout):
+        """The leader's result, or ``None`` if it didn't finish in time.
+
+        If the leader failed its exception is raised.
+        """
+
+        if not self._event.wait(timeout):
+            return None
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+class SingleFlight:
+    """Lets concurrent identical requests share one execution.
+
+    The first caller to ``join`` a key is the leader and must call
+    ``finish`` or ``fail`` on the flight. Everyone else joining before then
+    is a follower and waits on it.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+
+                return flight, False
+
+            flight = self._flights[key] = Flight()
+
+            return flight, True
+
+    def land(self, key, flight):
+        # later requests start a new flight rather than getting this result
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+from flask import request
+from pydantic import BaseModel
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional
+
+from .fields import Projection
+from .streaming import iter_json_array, iter_ndjson
+from .utils import module_available
+
+import functools
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
+
+default_mime_type = "application/json"
+
+
+# yaml, msgpack and cbor2 are only imported the first time they're used, to
+# keep import time (and so cold starts) down
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml():
+    import yaml
+
+    # the libyaml backed classes are much faster, but are only available when
+    # pyyaml was built against libyaml
+    return (
+        yaml,
+        getattr(yaml, "CSafeLoader", yaml.SafeLoader),
+        getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+    )
+
+
+def to_builtins(value):
+    """Convert a model into plain data that any codec can represent."""
+
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+
+    if isinstance(value, Projection):
+        # fields outside the include set are never dumped
+        return value.model.model_dump(mode="json", include=value.include)
+
+    return value
+
+
+class Codec:
+    """A serialization format that requests and responses can use.
+
+    ``encode`` turns a response model (or plain data) into bytes and
+    ``decode`` turns a request body into plain data ready for validation.
+    Responses limited with ``?fields=`` are passed to ``encode`` as a
+    ``Projection``, which ``to_builtins`` understands. Codecs without
+    ``decode`` can only be used for responses. Codecs with ``encode_stream``
+    can write a response one item at a time, and codecs with
+    ``decode_stream`` can read a request body one item at a time from a
+    file-like object.
+    """
+
+    def __init__(
+        self,
+        mime_type: str,
+        encode: Callable[[Any], bytes],
+        decode: Optional[Callable[[bytes], Any]] = None,
+        encode_stream: Optional[Callable[[Iterable[Any]], Iterator[bytes]]] = None,
+        decode_stream: Optional[Callable[[BinaryIO], Iterator[Any]]] = None,
+    ):
+        self.mime_type = mime_type
+        self.encode = encode
+        self.decode = decode
+        self.encode_stream = encode_stream
+        self.decode_stream = decode_stream
+
+    @property
+    def streaming(self):
+        return self.encode_stream is not None
+
+    def __repr__(self):
+        return "<Codec %s>" % self.mime_type
+
+
+class CodecRegistry:
+    """Ordered set of codecs, keyed on mime type.
+
+    Order matters: it is used as the preference order when negotiating
+    against an ``Accept`` header, and in the generated OpenAPI document.
+    """
+
+    def __init__(self, codecs: Iterable[Codec] = (), default: str = default_mime_type):
+        self._codecs: Dict[str, Codec] = {}
+        self.default = default
+        self.mime_types = ()
+        self.decodable_mime_types = ()
+        self.streaming_mime_types = ()
+
+        for codec in codecs:
+            self.register(codec)
+
+    def _refresh(self):
+        self.mime_types = tuple(self._codecs)
+        self.decodable_mime_types = tuple(
+            mime_type
+            for mime_type, codec in self._codecs.items()
+            if codec.decode is not None
+        )
+        self.streaming_mime_types = tuple(
+            mime_type for mime_type, codec in self._codecs.items() if codec.streaming
+        )
+
+    def register(self, codec: Codec):
+        self._codecs[codec.mime_type] = codec
+        self._refresh()
+
+    def unregister(self, mime_type: str):
+        assert mime_type != self.default, "cannot remove the default codec"
+
+        del self._codecs[mime_type]
+        self._refresh()
+
+    def get(self, mime_type: str) -> Optional[Codec]:
+        return self._codecs.get(mime_type)
+
+    def __getitem__(self, mime_type: str) -> Codec:
+        return self._codecs[mime_type]
+
+    def __contains__(self, mime_type: str) -> bool:
+        return mime_type in self._codecs
+
+    def __iter__(self):
+        return iter(self._codecs.values())
+
+    def __len__(self):
+        return len(self._codecs)
+
+
+def encode_json(value):
+    if isinstance(value, BaseModel):
+        # pydantic-core writes the model straight to json bytes, skipping the
+        # intermediate dict and str copies
+        return value.__pydantic_serializer__.to_json(value)
+
+    if isinstance(value, Projection):
+        model = value.model
+
+        return model.__pydantic_serializer__.to_json(model, include=value.include)
+
+    return orjson.dumps(value)
+
+
+def encode_json_stream(values):
+    # written as one json array, a piece at a time
+    separator = b"["
+
+    for value in values:
+        yield separator
+        yield encode_json(value)
+
+        separator = b","
+
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def encode_ndjson(value):
+    return encode_json(value) + b"\n"
+
+
+def decode_ndjson(data):
+    return [orjson.loads(line) for line in data.splitlines() if line.strip()]
+
+
+def encode_ndjson_stream(values):
+    for value in values:
+        yield encode_json(value)
+        yield b"\n"
+
+
+def encode_jsonp(value):
+    data = encode_json(value)
+
+    callback = request.args.get("callback")
+
+    if callback:
+        data = b"%s(%s)" % (callback.encode("utf-8"), data)
+
+    return data
+
+
+def encode_yaml(value):
+    yaml, _, dumper = _yaml()
+
+    return yaml.dump(to_builtins(value), Dumper=dumper).encode("utf-8")
+
+
+def decode_yaml(data):
+    yaml, loader, _ = _yaml()
+
+    return yaml.load(data, Loader=loader)
+
+
+def encode_msgpack(value):
+    import msgpack
+
+    return msgpack.packb(to_builtins(value))
+
+
+def decode_msgpack(data):
+    import msgpack
+
+    return msgpack.unpackb(data)
+
+
+def decode_msgpack_stream(stream):
+    import msgpack
+
+    # a sequence of msgpack objects
+    return iter(msgpack.Unpacker(stream))
+
+
+def encode_msgpack_stream(values):
+    import msgpack
+
+    packer = msgpack.Packer()
+
+    for value in values:
+        yield packer.pack(to_builtins(value))
+
+
+def encode_cbor(value):
+    import cbor2
+
+    return cbor2.dumps(to_builtins(value))
+
+
+def decode_cbor(data):
+    import cbor2
+
+    return cbor2.loads(data)
+
+
+def encode_cbor_stream(values):
+    import cbor2
+
+    # a cbor sequence, RFC 8742
+    for value in values:
+        yield cbor2.dumps(to_builtins(value))
+
+
+def default_codecs():
+    codecs = [
+        # both json flavours honour ?callback= for jsonp clients
+        Codec(
+            "application/json",
+            encode_jsonp,
+            orjson.loads,
+            encode_stream=encode_json_stream,
+            decode_stream=iter_json_array,
+        ),
+        Codec("application/javascript", encode_jsonp),
+        Codec(
+            "application/x-ndjson",
+            encode_ndjson,
+            decode_ndjson,
+            encode_stream=encode_ndjson_stream,
+            decode_stream=iter_ndjson,
+        ),
+        Codec("application/x-yaml", encode_yaml, decode_yaml),
+    ]
+
+    if module_available("msgpack"):
+        codecs.append(
+            Codec(
+                "application/msgpack",
+                encode_msgpack,
+                decode_msgpack,
+                encode_stream=encode_msgpack_stream,
+                decode_stream=decode_msgpack_stream,
+            )
+        )
+
+    if module_available("cbor2"):
+        codecs.append(
+            Codec(
+                "application/cbor",
+                encode_cbor,
+                decode_cbor,
+                encode_stream=encode_cbor_stream,
+            )
+        )
+
+    return codecs
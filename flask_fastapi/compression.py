@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+from werkzeug.http import parse_accept_header
+
+from .cache import LRUCache
+from .utils import module_available
+
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# there's no point spending cpu on formats that are already compressed
+_incompressible_prefixes = (
+    "image/",
+    "audio/",
+    "video/",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zstd",
+)
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        # sync flush so the client can decode each chunk as it arrives
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, level):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level):
+        import zstandard
+
+        self._zstandard = zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(
+            self._zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def _gzip(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    return compressor.compress(data) + compressor.flush()
+
+
+def _brotli(data, level):
+    import brotli
+
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+class Compression:
+    """Negotiated response compression.
+
+    Assign an instance to ``FlaskFastAPI.compression`` to compress responses
+    for clients that send a suitable ``Accept-Encoding``. zstd and brotli
+    are used in preference to gzip when the optional ``zstandard`` and
+    ``brotli`` packages are installed. Bodies smaller than ``min_size``
+    bytes are sent as-is.
+    """
+
+    default_levels = {
+        "zstd": 3,
+        "br": 4,
+        "gzip": 6,
+    }
+
+    def __init__(self, min_size=1024, levels=None, encodings=None):
+        self.min_size = min_size
+        self.levels = {**self.default_levels, **(levels or {})}
+
+        available = {
+            "zstd": (_zstd, _ZstdStream) if module_available("zstandard") else None,
+            "br": (_brotli, _BrotliStream) if module_available("brotli") else None,
+            "gzip": (_gzip, _GzipStream),
+        }
+
+        self._compressors = {
+            encoding: available[encoding]
+            for encoding in (encodings or available)
+            if available.get(encoding) is not None
+        }
+        self.encodings = tuple(self._compressors)
+        self.accept_encoding_cache = LRUCache(maxsize=64)
+
+    def negotiate(self, accept_encoding):
+        """The encoding to use for an ``Accept-Encoding`` header, or ``None``."""
+
+        encoding = self.accept_encoding_cache.get(accept_encoding, False)
+
+        if encoding is False:
+            encoding = None
+
+            if accept_encoding:
+                accept = parse_accept_header(accept_encoding)
+                encoding = accept.best_match(self.encodings)
+
+            self.accept_encoding_cache.set(accept_encoding, encoding)
+
+        return encoding
+
+    def compressible(self, mimetype):
+        return not (mimetype or "").startswith(_incompressible_prefixes)
+
+    def compress(self, data, encoding):
+        compress, _ = self._compressors[encoding]
+
+        return compress(data, self.levels[encoding])
+
+    def compress_stream(self, chunks, encoding):
+        _, stream_class = self._compressors[encoding]
+        compressor = stream_class(self.levels[encoding])
+
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+
+            if compressed:
+                yield compressed
+
+        yield compressor.finish()
+
+    def apply(self, response, accept_encoding):
+        """Compress ``response`` in place if the client and body allow it."""
+
+        response.vary.add("Accept-Encoding")
+
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or not self.compressible(response.mimetype)
+        ):
+            return response
+
+        encoding = self.negotiate(accept_encoding)
+
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+
+        else:
+            data = response.get_data()
+
+            if len(data) < self.min_size:
+                return response
+
+            response.set_data(self.compress(data, encoding))
+
+        response.headers["Content-Encoding"] = encoding
+
+        # the compressed body is a different representation, so a strong etag
+        # no longer applies to it
+        etag, weak = response.get_etag()
+
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
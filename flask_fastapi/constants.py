@@ -12,3 +12,12 @@ class HttpMethod(str, Enum):
     PUT = "PUT"
     DELETE = "DELETE"
     PATCH = "PATCH"
+
+
+class ParamSource(str, Enum):
+    PATH = "path"
+    QUERY = "query"
+    BODY = "body"
+    BACKGROUND = "background"
+    DEPENDENCY = "dependency"
+    PRINCIPAL = "principal"
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, NamedTuple, Tuple
+
+from .utils import PerProcess
+
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+# how a dependency's parameter is populated
+ARGUMENT_DEPENDENCY = "dependency"
+ARGUMENT_PARAM = "param"
+ARGUMENT_BACKGROUND = "background"
+ARGUMENT_PRINCIPAL = "principal"
+
+
+class Depends:
+    """Marks a handler parameter as provided by ``dependency``.
+
+    Used as the parameter's default, e.g. ``db: Session = Depends(get_db)``.
+    The dependency's own parameters are populated the same way a handler's
+    are: query and path arguments, ``BackgroundTasks``, ``principal`` and
+    other dependencies.
+
+    With the ``"request"`` scope the dependency is called once per request,
+    however many parameters and other dependencies use it, unless
+    ``use_cache`` is false. With the ``"app"`` scope it's called once per
+    process and the result shared by every request, e.g. for connection
+    pools. App scoped dependencies can only depend on other app scoped
+    dependencies.
+
+    Generator dependencies are set up by running them to their ``yield``
+    and torn down by running them to completion: request scoped ones once
+    the response has been sent, app scoped ones when the process exits or
+    ``FlaskFastAPI.close_dependencies()`` is called. ``async def``
+    dependencies and async generators are run on the app's event loop.
+    """
+
+    def __init__(self, dependency: Callable, use_cache=True, scope="request"):
+        assert scope in ("request", "app"), "scope must be request or app"
+
+        self.dependency = dependency
+        self.use_cache = use_cache
+        self.scope = scope
+
+    def __repr__(self):
+        return "Depends(%s, scope=%r)" % (
+            getattr(self.dependency, "__name__", self.dependency),
+            self.scope,
+        )
+
+
+class DependencyNode(NamedTuple):
+    func: Callable
+    scope: str
+    generator: bool
+    is_async: bool
+    # (parameter name, ARGUMENT_*, node index or parameter name)
+    arguments: Tuple[Tuple[str, str, Any], ...]
+
+
+def _finish(gen):
+    try:
+        next(gen)
+
+    except StopIteration:
+        pass
+
+    else:
+        logger.warning("dependency %r yielded more than once", gen)
+
+
+def _finish_async(gen, run):
+    try:
+        run(gen.__anext__())
+
+    except StopAsyncIteration:
+        pass
+
+    else:
+        logger.warning("dependency %r yielded more than once", gen)
+
+
+def _guarded(finish):
+    # runs once the response has been sent, when there's no one to tell
+    def teardown():
+        try:
+            finish()
+
+        except Exception:
+            logger.exception("error tearing down a request scoped dependency")
+
+    return teardown
+
+
+def _call(node, arguments, run):
+    """Call a dependency, returning its value and how to tear it down."""
+
+    value = node.func(**arguments)
+
+    if node.generator and node.is_async:
+        return run(value.__anext__()), lambda: _finish_async(value, run)
+
+    if node.generator:
+        return next(value), lambda: _finish(value)
+
+    if node.is_async:
+        return run(value), None
+
+    return value, None
+
+
+class DependencyPlan(NamedTuple):
+    """Dependencies of a handler, in the order they have to be called.
+
+    Compiled once by ``compile_dependencies``. ``targets`` maps handler
+    parameters to the node that provides them, and ``private`` lists the
+    query and path arguments only dependencies use, which aren't passed on
+    to the handler.
+    """
+
+    nodes: Tuple[DependencyNode, ...]
+    targets: Tuple[Tuple[str, int], ...]
+    private: Tuple[str, ...]
+    background: bool
+    principal: bool
+
+    def solve(self, app_scope, kwargs, provided, stack, run):
+        """Call the dependencies and fill in the handler's ``kwargs``.
+
+        ``provided`` holds the values the framework supplies, by
+        ``ARGUMENT_*`` kind.
+        """
+
+        values = []
+
+        for node in self.nodes:
+            if node.scope == "app":
+                values.append(app_scope.get(node, values, run))
+
+                continue
+
+            value, teardown = _call(
+                node, _arguments(node, values, kwargs, provided), run
+            )
+
+            if teardown is not None:
+                stack.callback(_guarded(teardown))
+
+            values.append(value)
+
+        for name in self.private:
+            kwargs.pop(name, None)
+
+        for name, index in self.targets:
+            kwargs[name] = values[index]
+
+        return kwargs
+
+
+def _arguments(node, values, kwargs, provided):
+    arguments = {}
+
+    for name, kind, ref in node.arguments:
+        if kind == ARGUMENT_DEPENDENCY:
+            arguments[name] = values[ref]
+
+        elif kind in (ARGUMENT_BACKGROUND, ARGUMENT_PRINCIPAL):
+            arguments[name] = provided.get(kind)
+
+        elif ref in kwargs:
+            arguments[name] = kwargs[ref]
+
+    return arguments
+
+
+class AppScope:
+    """Values of app scoped dependencies for this process."""
+
+    def __init__(self):
+        self._process = PerProcess(self._reset)
+        self._registered = False
+
+    def _reset(self):
+        # connections made before a fork belong to the parent
+        self._values = {}
+        self._teardown = []
+        self._lock = threading.Lock()
+
+    def get(self, node, values, run):
+        self._process.ensure()
+
+        value = self._values.get(node.func, _missing)
+
+        if value is _missing:
+            with self._lock:
+                value = self._values.get(node.func, _missing)
+
+                if value is _missing:
+                    value, teardown = _call(node, _arguments(node, values, {}, {}), run)
+
+                    if teardown is not None:
+                        self._teardown.append(teardown)
+
+                        if not self._registered:
+                            atexit.register(self.close)
+                            self._registered = True
+
+                    self._values[node.func] = value
+
+        return value
+
+    def close(self):
+        if not self._process.started:
+            return
+
+        with self._lock:
+            teardown, self._teardown = self._teardown, []
+            self._values = {}
+
+        for finish in reversed(teardown):
+            try:
+                finish()
+
+            except Exception:
+                logger.exception("error tearing down an app scoped dependency")
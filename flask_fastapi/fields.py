@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+from pydantic import BaseModel
+from typing import Any, Dict, NamedTuple, Optional, get_args, get_origin
+
+from .exceptions import BadRequestException
+
+import collections.abc
+import logging
+
+logger = logging.getLogger(__name__)
+
+# self referencing models would otherwise go on forever
+max_depth = 8
+
+_collection_origins = (
+    list,
+    tuple,
+    set,
+    frozenset,
+    dict,
+    collections.abc.Sequence,
+    collections.abc.Set,
+    collections.abc.Mapping,
+)
+
+
+class FieldNode(NamedTuple):
+    # lists and dicts of models need "__all__" in an include set
+    collection: bool
+    children: Optional[Dict[str, "FieldNode"]]
+
+
+class Projection(NamedTuple):
+    """A model to be serialized with only the ``include`` fields."""
+
+    model: BaseModel
+    include: Dict[str, Any]
+
+
+def _nested_model(annotation):
+    """The model inside an annotation, and whether it's in a collection."""
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+
+    origin = get_origin(annotation)
+
+    for arg in get_args(annotation):
+        model, collection = _nested_model(arg)
+
+        if model is not None:
+            return model, collection or origin in _collection_origins
+
+    return None, False
+
+
+def field_tree(model, depth=0) -> Dict[str, FieldNode]:
+    """Every field path that can be selected from ``model``."""
+
+    tree = {}
+
+    for name, field in model.model_fields.items():
+        nested, collection = _nested_model(field.annotation)
+        children = None
+
+        if nested is not None and depth < max_depth:
+            children = field_tree(nested, depth + 1)
+
+        tree[name] = FieldNode(collection, children)
+
+    return tree
+
+
+def _select(spec, tree):
+    selection = {}
+
+    for path in spec.split(","):
+        path = path.strip()
+
+        if not path:
+            continue
+
+        node_tree = tree
+        target = selection
+        parts = path.split(".")
+
+        for i, part in enumerate(parts):
+            if node_tree is None or part not in node_tree:
+                raise BadRequestException("Unknown field %s" % path)
+
+            if target.get(part) is True:
+                # the whole field is already included
+                break
+
+            if i == len(parts) - 1:
+                target[part] = True
+
+            else:
+                target = target.setdefault(part, {})
+                node_tree = node_tree[part].children
+
+    return selection
+
+
+def _include(selection, tree):
+    include = {}
+
+    for name, selected in selection.items():
+        if selected is True:
+            include[name] = True
+
+            continue
+
+        node = tree[name]
+        nested = _include(selected, node.children)
+        include[name] = {"__all__": nested} if node.collection else nested
+
+    return include
+
+
+def compile_include(spec, tree) -> Optional[Dict[str, Any]]:
+    """Turn ``?fields=`` into a pydantic include set.
+
+    Paths are comma separated and nested fields are selected with dots,
+    e.g. ``id,items.name``. An empty spec selects everything.
+    """
+
+    selection = _select(spec, tree)
+
+    if not selection:
+        return None
+
+    return _include(selection, tree)
@@ -1,25 +1,73 @@
 # -*- coding: utf-8 -*-
 
-from flask import Flask, make_response, request, render_template
+from flask import (
+    Flask,
+    current_app,
+    g,
+    has_request_context,
+    request,
+    render_template,
+    stream_with_context,
+)
 from werkzeug.exceptions import HTTPException as WerkzeugHttpException
 from inspect import signature
-from pydantic import ValidationError
-from pydantic.error_wrappers import ValidationError as RealValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic import ValidationError as RealValidationError
 from pydantic.fields import FieldInfo
-from pydantic.schema import schema
-from typing import List
-
+from pydantic_core import PydanticUndefined
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Callable, List, Optional, Union
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import (
+    is_resource_modified,
+    parse_accept_header,
+    parse_options_header,
+)
+
+from flask.cli import AppGroup
+
+from .aws_lambda import handle_event
+from .aio import EventLoopThread
+from .background import BackgroundExecutor, BackgroundTasks
+from .coalesce import SingleFlight
+from .auth import CredentialCache, challenge, request_credential
+from .dependencies import ARGUMENT_BACKGROUND, ARGUMENT_PRINCIPAL, AppScope
+from .limits import ConcurrencyLimiter, render_prometheus as render_limits
+from .binding import (
+    Undefined,
+    bind_params,
+    compile_bindings,
+    compile_dependencies,
+    compile_params_adapter,
+)
+from .cache import CachedResponse, LRUCache, ResponseCache, default_cache_key
+from .codec import Codec, CodecRegistry, default_codecs, encode_yaml
 from .json import ORJSONEncoder, ORJSONDecoder
-from .constants import HttpMethod
-from .exceptions import BadRequestException, HttpException
+from .metrics import Metrics, server_timing
+from .profiling import Profiler
+from .reporting import ExceptionDispatcher
+from .constants import HttpMethod, ParamSource
+from .exceptions import BadRequestException, HttpException, UnauthorizedException
+from .fields import Projection, compile_include, field_tree
 from .schema import HttpErrorResponse, ValidationErrorResponse
-
+from .warmup import WarmupReport, annotation_models, rss_bytes
+from .streaming import (
+    buffer_chunks,
+    decode_body_stream,
+    prime_stream,
+    stream_item_type,
+)
+
+import click
+import gc
+import hashlib
 import inspect
 import logging
 import orjson
 import os.path
 import re
-import yaml
+import time
 
 __version__ = "0.0.1"
 
@@ -30,29 +78,9 @@ static_folder = os.path.join(base_dir, "static")
 template_folder = os.path.join(base_dir, "templates")
 
 
-def _serialize_json(data):
-    data = orjson.dumps(data).decode("utf-8")
-
-    callback = request.args.get("callback")
-
-    if callback:
-        data = "%s(%s)" % (callback, data)
-
-    return data
-
+_missing = object()
 
-serializers = {
-    "application/json": _serialize_json,
-    "application/javascript": _serialize_json,
-    "application/x-yaml": yaml.dump,
-}
-deserializers = {
-    "application/json": orjson.loads,
-    "application/x-yaml": yaml.load,
-}
-
-supported_serializers = list(serializers.keys())
-default_serializer = "application/json"
+_conditional_methods = (HttpMethod.GET, "HEAD")
 
 component_security = {
     "securitySchemes": {
@@ -77,6 +105,40 @@ openapi_security = [
 ]
 
 
+openapi_cli = AppGroup("openapi", help="OpenAPI document commands.")
+
+
+@openapi_cli.command("export")
+@click.option(
+    "--output",
+    "-o",
+    type=click.File("wb"),
+    default="-",
+    help="File to write the document to, defaults to stdout.",
+)
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["json", "yaml"]),
+    default="json",
+    help="Document format.",
+)
+def export_openapi_command(output, fmt):
+    """Write the openapi document, e.g. to load with openapi_snapshot."""
+
+    output.write(current_app.export_openapi(fmt))
+
+
+def _ref_schema(ref):
+    # refs are either the name of a model in components, or a whole schema
+    if isinstance(ref, dict):
+        return ref
+
+    return {
+        "$ref": "#/components/schemas/" + ref,
+    }
+
+
 class FlaskFastAPI(Flask):
     default_response_codes = {
         HttpMethod.GET: 200,
@@ -84,21 +146,343 @@ class FlaskFastAPI(Flask):
         HttpMethod.PUT: 202,
         HttpMethod.PATCH: 202,
         HttpMethod.DELETE: 204,
+        # flask answers HEAD with the GET handler
+        "HEAD": 200,
     }
 
-    def register_exception_reporter(self, reporter):
-        self.exception_reporters.append(reporter)
+    def lambda_handler(self, event, context=None):
+        """AWS Lambda entry point for API Gateway (v1 and v2) and ALB events.
+
+        e.g. ``handler = api.lambda_handler`` in the function's module.
+        """
+
+        try:
+            return handle_event(self, event, context)
+
+        finally:
+            # the process is frozen between invocations, so anything left
+            # running or queued wouldn't finish until the next one
+            self.background_executor.drain()
+            self.exception_dispatcher.flush()
+
+    def register_exception_reporter(self, reporter, batch=False):
+        """Have ``reporter(app, e)`` called for exceptions raised by handlers.
+
+        Reporters are called from a background thread, see
+        ``ExceptionDispatcher``, inside a request context rebuilt from the
+        failed request's method and url. With ``batch`` the reporter is instead
+        called as ``reporter(app, events)`` with a list of
+        ``ReportedException``, each with the number of times it happened.
+        """
+
+        if batch:
+            self.batch_exception_reporters.append(reporter)
+
+        else:
+            self.exception_reporters.append(reporter)
+
+    def _report_exception(self, e):
+        if self.exception_reporters or self.batch_exception_reporters:
+            self.exception_dispatcher.submit(e)
+
+    def invalidate_cache(self, endpoint, **kwargs):
+        """Drop cached responses for ``endpoint``.
+
+        With no arguments every response cached for the endpoint is dropped,
+        otherwise only the responses for those path and query arguments, in
+        every format and whatever ``?fields=`` or caller they were for.
+        Arguments should be given as the handler receives them, e.g.
+        ``invalidate_cache("get_item", item_id=3)``.
+        """
+
+        cache, param_bindings = self.response_caches[endpoint]
+
+        if not kwargs:
+            # the cache may be shared with other endpoints
+            cache.invalidate_endpoint(endpoint)
+
+            return
+
+        for binding in param_bindings:
+            if binding.name not in kwargs:
+                if binding.default_factory is not None:
+                    kwargs[binding.name] = binding.default_factory()
+
+                elif binding.default is not Undefined:
+                    kwargs[binding.name] = binding.default
+
+        for mime_type in self.codecs.mime_types:
+            cache.invalidate(endpoint, mime_type, kwargs)
+
+    def register_authenticator(self, scheme, authenticator):
+        """Verify credentials for one of the OpenAPI security schemes.
+
+        ``scheme`` is ``"bearerAuth"`` (an ``Authorization: Bearer`` token)
+        or ``"apiKeyAuth"`` (an ``X-API-Key`` header). ``authenticator``
+        is called with the credential and returns the principal, an
+        ``Authenticated`` with the principal and when the credential
+        expires, or ``None`` to reject it. Results are cached in
+        ``credential_cache``. Once an authenticator is registered, routes
+        with ``requires_auth`` reject requests without a valid credential.
+        """
+
+        assert scheme in component_security["securitySchemes"], (
+            "unknown security scheme %s" % scheme
+        )
+
+        self.authenticators[scheme] = authenticator
+
+    def authenticate(self, required=True):
+        """The principal for the current request's credentials.
+
+        Raises ``UnauthorizedException`` if none are valid, or returns
+        ``None`` when not ``required``.
+        """
+
+        for scheme, authenticator in self.authenticators.items():
+            credential = request_credential(scheme, request.headers)
+
+            if credential is None:
+                continue
+
+            principal = self.credential_cache.verify(scheme, credential, authenticator)
+
+            if principal is not None:
+                return principal
+
+        if required:
+            raise UnauthorizedException()
+
+        return None
+
+    def register_metrics_hook(self, hook):
+        """Call ``hook(endpoint, status, timings)`` after every request.
+
+        ``timings`` maps each phase of the request to the seconds it took,
+        e.g. to forward them to statsd.
+        """
+
+        self.metrics_hooks.append(hook)
+
+    def add_metrics_route(self, rule="/metrics"):
+        """Serve ``metrics`` in the Prometheus text format.
+
+        The route is left out of the OpenAPI document.
+        """
+
+        if self.metrics is None:
+            self.metrics = Metrics()
+
+        self.add_url_rule(
+            rule,
+            "metrics",
+            lambda: self.response_class(
+                self.metrics.render_prometheus()
+                + render_limits(self.concurrency_limits, self.metrics.prefix),
+                mimetype="text/plain; version=0.0.4",
+            ),
+            methods=[HttpMethod.GET],
+        )
+
+    def add_profiles_route(self, rule="/_profiles"):
+        """Serve the profiles captured by ``profiler`` as json.
+
+        The route is left out of the OpenAPI document. Profiles include
+        request arguments, so keep it away from the public internet.
+        """
+
+        if self.profiler is None:
+            self.profiler = Profiler()
+
+        self.add_url_rule(
+            rule,
+            "profiles",
+            lambda: self.response_class(
+                orjson.dumps(
+                    [profile.to_dict() for profile in self.profiler.profiles()]
+                ),
+                mimetype="application/json",
+            ),
+            methods=[HttpMethod.GET],
+        )
+
+    def close_dependencies(self):
+        """Tear down app scoped dependencies, they're set up again if used."""
+
+        self.dependency_scope.close()
+
+    def concurrency_stats(self):
+        """Load on each endpoint with ``max_concurrency``, by endpoint."""
+
+        return {
+            endpoint: limiter.stats()
+            for endpoint, limiter in self.concurrency_limits.items()
+        }
+
+    def overloaded_response(self):
+        """503 for requests turned away by an endpoint's concurrency limit.
+
+        The body is serialized once per format, shedding load should be
+        as cheap as possible.
+        """
+
+        codec = self.negotiate_codec()
+
+        if "callback" in request.args:
+            body = codec.encode(self._overloaded)
+
+        else:
+            body = self._overloaded_bodies.get(codec.mime_type)
+
+            if body is None:
+                body = self._overloaded_bodies[codec.mime_type] = codec.encode(
+                    self._overloaded
+                )
+
+        response = self.response_class(body, 503, content_type=codec.mime_type)
+        response.headers["Retry-After"] = str(self.retry_after)
+
+        return response
+
+    def _stored_response(self, stored, conditional, version_etag, modified):
+        # a response serialized earlier, by the cache or a coalesced request
+        response = self.response_class(
+            stored.body,
+            status=stored.status,
+            content_type=stored.content_type,
+        )
+
+        if conditional and 200 <= response.status_code < 300:
+            response = self.conditional_response(response, version_etag, modified)
+
+        return response
+
+    def _land_flight(self, exc):
+        leading = g.pop("_flask_fastapi_flight", None)
+
+        if leading is not None:
+            key, flight = leading
+            self.single_flight.land(key, flight)
+
+            if not flight.done:
+                flight.fail(exc or RuntimeError("request ended without a response"))
+
+    def _run_after(self, response, tasks):
+        # the server closes the response once the body has been sent
+        response.call_on_close(lambda: self.background_executor.submit(tasks))
+
+    def _record_timings(self, endpoint, response, timings, start):
+        if self.metrics is None and not self.metrics_hooks and not self.server_timing:
+            return
+
+        timings["total"] = time.perf_counter() - start
+        status = response.status_code
+
+        if self.server_timing:
+            response.headers["Server-Timing"] = server_timing(timings)
+
+        if self.metrics is not None:
+            self.metrics.observe(endpoint, status, timings)
+
+        for hook in self.metrics_hooks:
+            try:
+                hook(endpoint, status, timings)
+
+            except Exception:
+                # metrics mustn't break the request
+                logger.exception("metrics hook %r failed", hook)
+
+    def register_codec(self, codec: Codec):
+        self.codecs.register(codec)
+        self._codecs_changed()
+
+    def unregister_codec(self, mime_type: str):
+        self.codecs.unregister(mime_type)
+        self._codecs_changed()
+
+    def _codecs_changed(self):
+        # negotiation results may now be different
+        self.accept_cache.clear()
+        self.content_type_cache.clear()
+        self._overloaded_bodies.clear()
+
+        # the supported formats are listed in the openapi document
+        self._openapi_spec = None
+        self._openapi_rendered = {}
+
+    def negotiate_codec(self, streaming=False) -> Codec:
+        """Pick the codec for the response based on the Accept header.
+
+        Clients tend to send the same handful of Accept headers, so the
+        result is cached against the raw header value.
+        """
+
+        accept = request.headers.get("Accept", "")
+        key = (accept, streaming)
+        codec = self.accept_cache.get(key)
+
+        if codec is None:
+            supported = (
+                self.codecs.streaming_mime_types
+                if streaming
+                else self.codecs.mime_types
+            )
+            best = parse_accept_header(accept, MIMEAccept).best_match(supported)
+            codec = self.codecs[best or self.codecs.default]
+
+            self.accept_cache.set(key, codec)
+
+        return codec
+
+    def request_codec(self) -> Optional[Codec]:
+        """The codec for the request body, ``None`` if it isn't supported."""
+
+        content_type = request.headers.get("Content-Type", "")
+        codec = self.content_type_cache.get(content_type, _missing)
+
+        if codec is _missing:
+            # strips parameters such as "; charset=utf-8"
+            mime_type, _ = parse_options_header(content_type)
+            codec = self.codecs.get(mime_type.lower())
+
+            if codec is not None and codec.decode is None:
+                codec = None
+
+            self.content_type_cache.set(content_type, codec)
+
+        return codec
+
+    def _gen_stream_content(self, ref, mime_types, **extras):
+        item_schema = _ref_schema(ref)
+
+        content = {
+            "description": "",
+            "content": {
+                # json is written as a single array, other streaming formats
+                # as a sequence of items
+                mime_type: {
+                    "schema": (
+                        {"type": "array", "items": item_schema}
+                        if mime_type == "application/json"
+                        else item_schema
+                    ),
+                }
+                for mime_type in mime_types
+            },
+        }
+
+        content.update(extras)
+
+        return content
 
     def _gen_content(self, ref, **extras):
         content = {
             "description": "",
             "content": {
                 mime_type: {
-                    "schema": {
-                        "$ref": "#/components/schemas/" + ref,
-                    },
+                    "schema": _ref_schema(ref),
                 }
-                for mime_type in serializers
+                for mime_type in self.codecs.mime_types
             },
         }
 
@@ -112,8 +496,15 @@ class FlaskFastAPI(Flask):
         api_title,
         api_version,
         openapi_version="3.0.2",
+        openapi_snapshot=None,
     ):
 
+        # Flask registers the static route during __init__, which lands in
+        # add_url_rule before anything else has been set up
+        self._openapi_spec = None
+        self._openapi_rendered = {}
+        self._openapi_snapshot = None
+
         super().__init__(
             __name__,
             static_url_path="/static",
@@ -126,32 +517,87 @@ class FlaskFastAPI(Flask):
         self.openapi_version = openapi_version
         self.schema_metadata = {}
         self.exception_reporters = []
+        self.batch_exception_reporters = []
+        self.exception_dispatcher = ExceptionDispatcher(self)
+        self.background_executor = BackgroundExecutor(self)
+        self.dependency_scope = AppScope()
+
+        # see register_authenticator
+        self.authenticators = {}
+        self.credential_cache = CredentialCache()
+
+        # async def handlers, dependencies and background tasks run here
+        self.event_loop = EventLoopThread()
+
+        # concurrent identical requests to routes with coalesce=True
+        self.single_flight = SingleFlight()
+        self.coalesce_timeout = 10.0
+        self.teardown_request(self._land_flight)
+
+        # routes with max_concurrency wait up to queue_timeout seconds for a
+        # slot, and are otherwise told to retry after retry_after seconds
+        self.concurrency_limits = {}
+        self.queue_timeout = 5.0
+        self.retry_after = 1
+        self._overloaded = HttpErrorResponse(
+            code=503, name="Service unavailable. Please try again"
+        )
+        self._overloaded_bodies = {}
+        self.codecs = CodecRegistry(default_codecs())
+
+        if openapi_snapshot is not None:
+            self.load_openapi_snapshot(openapi_snapshot)
+
+        self.cli.add_command(openapi_cli)
+        self.accept_cache = LRUCache(maxsize=256)
+        self.content_type_cache = LRUCache(maxsize=64)
+        self.response_caches = {}
+
+        # app wide default for the etag option on routes
+        self.etag_responses = False
+
+        # set to a Compression to compress responses
+        self.compression = None
+        self._docs_rendered = {}
+
+        self.after_request(self._compress_response)
+
+        # set to a Metrics to record per endpoint timings, and server_timing
+        # to send them back in a Server-Timing header
+        self.metrics = None
+        self.metrics_hooks = []
+        self.server_timing = False
+
+        # set to a Profiler to capture profiles of slow requests
+        self.profiler = None
+
+        self.stream_buffer_size = 64 * 1024
 
         self.add_url_rule(
             "/openapi.yaml",
             "openapi_yaml",
-            lambda: yaml.dump(self.openapi()),
+            lambda: self._openapi_response("yaml"),
             methods=[HttpMethod.GET],
         )
 
         self.add_url_rule(
             "/openapi.json",
             "openapi_json",
-            lambda: self.openapi(),
+            lambda: self._openapi_response("json"),
             methods=[HttpMethod.GET],
         )
 
         self.add_url_rule(
             "/docs/",
             "swaggerui",
-            lambda: self.swaggerui(),
+            lambda: self._docs_response("swaggerui", self.swaggerui),
             methods=[HttpMethod.GET],
         )
 
         self.add_url_rule(
             "/redoc/",
             "redoc",
-            lambda: self.redoc(),
+            lambda: self._docs_response("redoc", self.redoc),
             methods=[HttpMethod.GET],
         )
 
@@ -164,7 +610,7 @@ class FlaskFastAPI(Flask):
 
             return self.serialize_response(model, e.code)
 
-        self._register_error_handler(None, WerkzeugHttpException, error_handler)
+        self.register_error_handler(WerkzeugHttpException, error_handler)
 
     def redoc(self):
         return render_template("redoc.html")
@@ -172,28 +618,343 @@ class FlaskFastAPI(Flask):
     def swaggerui(self):
         return render_template("swaggerui.html")
 
-    def serialize_response(self, model, status_code):
-        data = ""
-        best_serializer = None
+    def _compress_response(self, response):
+        if self.compression is not None:
+            response = self.compression.apply(
+                response, request.headers.get("Accept-Encoding", "")
+            )
+
+        return response
+
+    def _fixed_response(self, variants, body, mimetype, etag):
+        """Respond with a body that never changes.
 
-        if model is not None:
-            data = model.dict()
+        Each compressed form is produced once and kept in ``variants``, and
+        each gets its own etag.
+        """
 
-            best_serializer = (
-                request.accept_mimetypes.best_match(list(serializers.keys()))
-                or default_serializer
+        encoding = None
+
+        if self.compression is not None and len(body) >= self.compression.min_size:
+            encoding = self.compression.negotiate(
+                request.headers.get("Accept-Encoding", "")
             )
 
-            data = serializers[best_serializer](data)
+        if encoding is not None:
+            if encoding not in variants:
+                variants[encoding] = self.compression.compress(body, encoding)
+
+            body = variants[encoding]
+            etag = "%s-%s" % (etag, encoding)
+
+        response = self.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+
+        if self.compression is not None:
+            response.vary.add("Accept-Encoding")
+
+        return response.make_conditional(request)
+
+    def _docs_response(self, name, render):
+        if name not in self._docs_rendered:
+            body = render().encode("utf-8")
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+            self._docs_rendered[name] = (body, etag, {})
+
+        body, etag, variants = self._docs_rendered[name]
+
+        return self._fixed_response(variants, body, "text/html", etag)
+
+    def warmup(self, freeze=False) -> WarmupReport:
+        """Build everything that would otherwise be built lazily.
+
+        Meant to be called once the app has been imported and before the
+        server forks its workers (e.g. gunicorn ``--preload``), so that the
+        work is done once and the result is shared copy-on-write rather
+        than repeated in every worker. With ``freeze`` the objects created
+        so far are moved out of the garbage collector's reach with
+        ``gc.freeze()``, so collections in the workers don't touch, and so
+        copy, those pages.
+        """
+
+        start = time.perf_counter()
+        rss_before = rss_bytes()
+        endpoints = 0
+
+        for view in self.view_functions.values():
+            func_sig = getattr(view, "signature", None)
+
+            if func_sig is None:
+                continue
+
+            endpoints += 1
+
+            # models configured with defer_build are only built on first use
+            annotations = [p.annotation for p in func_sig.parameters.values()]
+            annotations.append(func_sig.return_annotation)
+
+            for annotation in annotations:
+                for model in annotation_models(annotation):
+                    model.model_rebuild()
+
+        rendered = self._render_openapi("/")
+
+        # the accept headers nearly every client sends
+        for accept in ("*/*", self.codecs.default):
+            with self.test_request_context("/", headers={"Accept": accept}):
+                self.negotiate_codec()
+                self.negotiate_codec(streaming=True)
+                self.overloaded_response()
+
+        with self.test_request_context("/"):
+            error = HttpErrorResponse(code=500, name="warmup")
+
+            for codec in self.codecs:
+                # imports any modules the codec loads on first use
+                codec.encode(error)
+
+            self.negotiate_codec()
+            self.negotiate_codec(streaming=True)
+
+            self._docs_response("swaggerui", self.swaggerui)
+            self._docs_response("redoc", self.redoc)
+
+        if self.compression is not None:
+            bodies = [(body, variants) for body, _, _, variants in rendered.values()]
+            bodies.extend(
+                (body, variants) for body, _, variants in self._docs_rendered.values()
+            )
+
+            for body, variants in bodies:
+                if len(body) < self.compression.min_size:
+                    continue
+
+                for encoding in self.compression.encodings:
+                    if encoding not in variants:
+                        variants[encoding] = self.compression.compress(body, encoding)
+
+        frozen_objects = 0
+
+        if freeze:
+            gc.collect()
+            gc.freeze()
+            frozen_objects = gc.get_freeze_count()
+
+        report = WarmupReport(
+            endpoints=endpoints,
+            seconds=time.perf_counter() - start,
+            rss_before=rss_before,
+            rss_after=rss_bytes(),
+            frozen_objects=frozen_objects,
+        )
+
+        logger.info(
+            "warmed up %d endpoints in %.3fs, rss grew by %d bytes",
+            report.endpoints,
+            report.seconds,
+            report.rss_growth,
+        )
+
+        return report
+
+    def add_url_rule(self, *args, **kwargs):
+        super().add_url_rule(*args, **kwargs)
+
+        # a new route means the cached openapi document is out of date
+        self._openapi_spec = None
+        self._openapi_rendered = {}
+
+    def _openapi_server(self):
+        # a relative server url keeps the document independent of the Host
+        # header, so the same cached bytes can be served to every client
+        if has_request_context():
+            return request.script_root or "/"
+
+        return "/"
+
+    def _render_openapi(self, server):
+        openapi = self.openapi(server)
+        rendered = {}
+
+        body_json = orjson.dumps(openapi)
+
+        # round trip through json so that the safe yaml dumper only ever
+        # sees plain data
+        body_yaml = encode_yaml(orjson.loads(body_json))
 
-        response = make_response(data, status_code)
+        for fmt, mimetype, body in (
+            ("json", "application/json", body_json),
+            ("yaml", "application/x-yaml", body_yaml),
+        ):
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            rendered[fmt] = (body, mimetype, etag, {})
 
-        if best_serializer:
-            response.headers["Content-Type"] = best_serializer
+        self._openapi_rendered[server] = rendered
+
+        return rendered
+
+    def _openapi_response(self, fmt):
+        server = self._openapi_server()
+        rendered = self._openapi_rendered.get(server) or self._render_openapi(server)
+        body, mimetype, etag, variants = rendered[fmt]
+
+        return self._fixed_response(variants, body, mimetype, etag)
+
+    def serialize_response(self, model, status_code, include=None):
+        if model is None:
+            return self.response_class(status=status_code)
+
+        codec = self.negotiate_codec()
+
+        if include is not None:
+            # only the selected fields are dumped
+            model = Projection(model, include)
+
+        # codecs return bytes, which the response holds on to as-is
+        return self.response_class(
+            codec.encode(model),
+            status=status_code,
+            content_type=codec.mime_type,
+        )
+
+    def not_modified_response(self, etag=None, last_modified=None):
+        response = self.response_class(status=304)
+
+        if etag:
+            response.set_etag(etag)
+
+        if last_modified:
+            response.last_modified = last_modified
 
         return response
 
-    def openapi(self):
+    def conditional_response(self, response, etag=None, last_modified=None):
+        """Tag ``response`` and swap it for a 304 if the client is up to date.
+
+        Without an ``etag`` one is computed by hashing the serialized body.
+        """
+
+        if etag is None:
+            etag = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+
+        if not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified
+        ):
+            return self.not_modified_response(etag, last_modified)
+
+        response.set_etag(etag)
+
+        if last_modified:
+            response.last_modified = last_modified
+
+        return response
+
+    def stream_response(self, items, status_code, include=None):
+        codec = self.negotiate_codec(streaming=True)
+
+        if include is not None:
+            items = (Projection(item, include) for item in items)
+
+        def guarded(items):
+            # the status line has already gone out by the time a failure
+            # happens. the error is re-raised so the server aborts the
+            # response, rather than the codec closing off a body that looks
+            # complete but is missing items
+            try:
+                yield from items
+
+            except Exception as e:
+                logger.exception("error while streaming response")
+                self._report_exception(e)
+
+                raise
+
+        chunks = codec.encode_stream(guarded(items))
+
+        return self.response_class(
+            stream_with_context(buffer_chunks(chunks, self.stream_buffer_size)),
+            status=status_code,
+            content_type=codec.mime_type,
+        )
+
+    def _schema_ref(self, annotation, schemas, definitions):
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            schemas.append(annotation)
+
+            return annotation.__name__
+
+        schema = TypeAdapter(annotation).json_schema(
+            ref_template="#/components/schemas/{model}"
+        )
+        definitions.update(schema.pop("$defs", {}))
+
+        return schema
+
+    def load_openapi_snapshot(self, path):
+        """Serve the openapi document written by ``flask openapi export``.
+
+        Generating the document means building a schema for every model, so
+        loading a snapshot made at build time saves that work on a cold
+        start. The snapshot is used as-is, so it needs to be exported again
+        whenever routes or models change.
+        """
+
+        try:
+            with open(path, "rb") as f:
+                snapshot = orjson.loads(f.read())
+
+        except FileNotFoundError:
+            logger.warning("openapi snapshot %s not found, generating instead", path)
+
+            return
+
+        snapshot.pop("servers", None)
+
+        self._openapi_snapshot = snapshot
+        self._openapi_rendered = {}
+
+    def export_openapi(self, fmt="json"):
+        """A freshly generated openapi document, serialized deterministically."""
+
+        openapi = {
+            **self._build_openapi(),
+            "servers": [
+                {
+                    "url": "/",
+                },
+            ],
+        }
+        body = orjson.dumps(openapi, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2)
+
+        if fmt == "yaml":
+            body = encode_yaml(orjson.loads(body))
+
+        return body
+
+    def openapi(self, server=None):
+        if self._openapi_snapshot is not None:
+            spec = self._openapi_snapshot
+
+        else:
+            if self._openapi_spec is None:
+                self._openapi_spec = self._build_openapi()
+
+            spec = self._openapi_spec
+
+        return {
+            **spec,
+            "servers": [
+                {
+                    "url": server or self._openapi_server(),
+                },
+            ],
+        }
+
+    def _build_openapi(self):
         paths = {}
 
         info = {
@@ -206,6 +967,10 @@ class FlaskFastAPI(Flask):
             HttpErrorResponse,
         ]
 
+        # definitions pulled out of schemas for anything that isn't a model,
+        # e.g. List[Model]
+        definitions = {}
+
         # these responses will be included with every request response in the
         # openapi
         default_responses = {
@@ -240,8 +1005,8 @@ class FlaskFastAPI(Flask):
                 "description": "Request use of a particular data serialization.",
                 "schema": {
                     "type": "string",
-                    "default": default_serializer,
-                    "enum": supported_serializers,
+                    "default": self.codecs.default,
+                    "enum": list(self.codecs.mime_types),
                 },
             },
         ]
@@ -251,7 +1016,22 @@ class FlaskFastAPI(Flask):
             "name": "Content-Type",
             "description": "The data format that the request body is serialized in.",
             "required": True,
-            "schema": {"type": "string", "enum": list(serializers.keys())},
+            "schema": {
+                "type": "string",
+                "enum": list(self.codecs.decodable_mime_types),
+            },
+        }
+
+        fields_parameter = {
+            "in": "query",
+            "name": "fields",
+            "description": "Comma separated fields to include in the response, "
+            "nested fields separated with dots, e.g. id,items.name. "
+            "Everything is included by default.",
+            "required": False,
+            "schema": {
+                "type": "string",
+            },
         }
 
         method_parameters = {
@@ -285,12 +1065,20 @@ class FlaskFastAPI(Flask):
 
                         if "body" in metadata:
                             body = metadata["body"]
+                            body_item = stream_item_type(body)
 
-                            schemas.append(body)
+                            if body_item is not None:
+                                request_body = self._gen_stream_content(
+                                    self._schema_ref(body_item, schemas, definitions),
+                                    self.codecs.decodable_mime_types,
+                                    required=True,
+                                )
 
-                            request_body = self._gen_content(
-                                body.__name__, required=True
-                            )
+                            else:
+                                request_body = self._gen_content(
+                                    self._schema_ref(body, schemas, definitions),
+                                    required=True,
+                                )
                             # request_body = {
                             #     'required': True,
                             #     'content': {
@@ -305,16 +1093,23 @@ class FlaskFastAPI(Flask):
                         parameters = default_parameters.copy()
                         parameters.extend(method_parameters.get(method))
 
-                        for field, parameter in sig.parameters.items():
-                            if field == "body":
-                                # body is a keyword used for json body
-                                continue
+                        # only the path and query arguments, including those
+                        # used by dependencies. the body and parameters the
+                        # framework populates aren't sent by the client
+                        for field, parameter in metadata["parameters"].items():
 
                             param = {
                                 "name": field,
                                 # 'description': ...
                             }
 
+                            if (
+                                isinstance(parameter.default, FieldInfo)
+                                and parameter.default.alias
+                            ):
+                                # what the client sends
+                                param["name"] = parameter.default.alias
+
                             if field in rule.arguments:
                                 param["in"] = "path"
                                 param["required"] = True
@@ -322,30 +1117,32 @@ class FlaskFastAPI(Flask):
                             else:
                                 param["in"] = "query"
 
-                            if parameter.annotation:
-                                type_map = {
-                                    "str": "string",
-                                    "UUID": "string",
-                                    "int": "integer",
-                                }
+                                if parameter.default is inspect._empty or (
+                                    isinstance(parameter.default, FieldInfo)
+                                    and parameter.default.is_required()
+                                ):
+                                    param["required"] = True
 
-                                assert parameter.annotation.__name__ != "_empty", (
+                            if parameter.annotation:
+                                assert parameter.annotation is not inspect._empty, (
                                     "declare parameter %s with a type notation in function declaration %s %s"
                                     % (field, method, rule_normalised)
                                 )
 
-                                param["schema"] = {
-                                    "type": type_map.get(
-                                        parameter.annotation.__name__,
-                                        parameter.annotation.__name__,
-                                    ),
-                                }
+                                param["schema"] = _ref_schema(
+                                    self._schema_ref(
+                                        parameter.annotation, schemas, definitions
+                                    )
+                                )
 
                             if parameter.default:
                                 if isinstance(parameter.default, FieldInfo):
                                     param["description"] = parameter.default.description
 
-                                    if parameter.default.default != Ellipsis:
+                                    if parameter.default.default not in (
+                                        Ellipsis,
+                                        PydanticUndefined,
+                                    ):
                                         param["default"] = parameter.default.default
 
                                 elif parameter.default not in (
@@ -356,9 +1153,22 @@ class FlaskFastAPI(Flask):
 
                             parameters.append(param)
 
+                        if metadata["fields"]:
+                            parameters.append(fields_parameter)
+
                         response = None
 
-                        if sig.return_annotation is not inspect._empty:
+                        stream_item = stream_item_type(sig.return_annotation)
+
+                        if stream_item is not None:
+                            schemas.append(stream_item)
+
+                            response = self._gen_stream_content(
+                                stream_item.__name__,
+                                self.codecs.streaming_mime_types,
+                            )
+
+                        elif sig.return_annotation is not inspect._empty:
                             schemas.append(sig.return_annotation)
 
                             response = self._gen_content(sig.return_annotation.__name__)
@@ -406,23 +1216,22 @@ class FlaskFastAPI(Flask):
 
                         paths[rule_normalised][method.lower()] = method_schema
 
-        server = request.url[0 : request.url.index("/", 8)]
+        # pydantic puts these in a sub-key "$defs", so lets just pull that out
+        # only needed here, so imported when the document is first built
+        from pydantic.json_schema import models_json_schema
 
-        # pydantic puts these in a sub-key "definitions", so lets just pull that out
-        schemas = schema(schemas, ref_prefix="#/components/schemas/")
+        _, schemas = models_json_schema(
+            [(model, "validation") for model in dict.fromkeys(schemas)],
+            ref_template="#/components/schemas/{model}",
+        )
 
         openapi = {
             "openapi": self.openapi_version,
-            "servers": [
-                {
-                    "url": server,
-                },
-            ],
             "paths": paths,
             "info": info,
             "components": {
                 **component_security,
-                "schemas": schemas["definitions"],
+                "schemas": {**definitions, **schemas.get("$defs", {})},
             },
         }
 
@@ -437,6 +1246,14 @@ class FlaskFastAPI(Flask):
         response_code: int = None,
         requires_auth: bool = True,
         private: bool = False,
+        cache: Optional[ResponseCache] = None,
+        etag: Optional[bool] = None,
+        version: Optional[Callable[..., str]] = None,
+        last_modified: Optional[Callable[..., datetime]] = None,
+        coalesce: Union[bool, float] = False,
+        fields: bool = False,
+        max_concurrency: Optional[int] = None,
+        max_queue: int = 0,
         **kwargs,
     ):
         def decorator(func):
@@ -446,69 +1263,181 @@ class FlaskFastAPI(Flask):
             if "body" in func_sig.parameters:
                 body_class = func_sig.parameters["body"].annotation
 
-            def _decorated(*args, **kwargs):
+            # work out how each parameter is populated once, rather than on
+            # every request
+            bindings = compile_bindings(func_sig, rule)
+            body_binding = next(
+                (b for b in bindings if b.source == ParamSource.BODY), None
+            )
+            background_binding = next(
+                (b for b in bindings if b.source == ParamSource.BACKGROUND), None
+            )
+            principal_binding = next(
+                (b for b in bindings if b.source == ParamSource.PRINCIPAL), None
+            )
+            param_bindings = tuple(
+                b for b in bindings if b.source in (ParamSource.QUERY, ParamSource.PATH)
+            )
+            parameters = {b.name: func_sig.parameters[b.name] for b in param_bindings}
+
+            # the graph of dependencies is worked out once, the query and path
+            # arguments they use are validated along with the handler's
+            dependencies, dependency_bindings, dependency_parameters = (
+                compile_dependencies(bindings, rule)
+            )
+
+            for binding in dependency_bindings:
+                if binding.name not in parameters:
+                    param_bindings += (binding,)
+                    parameters[binding.name] = dependency_parameters[binding.name]
+
+            params_adapter = compile_params_adapter(param_bindings, parameters)
+            uses_principal = principal_binding is not None or (
+                dependencies is not None and dependencies.principal
+            )
+            stream_item = stream_item_type(func_sig.return_annotation)
+
+            assert cache is None or stream_item is None, (
+                "streamed responses from %s can't be cached" % func.__name__
+            )
+            # the key leaves out the body
+            assert cache is None or all(m in _conditional_methods for m in methods), (
+                "only GET responses from %s can be cached" % func.__name__
+            )
+            assert not coalesce or stream_item is None, (
+                "streamed responses from %s can't be coalesced" % func.__name__
+            )
+            # the key leaves out the body, requests with different ones
+            # would get the same response
+            assert not coalesce or all(m in _conditional_methods for m in methods), (
+                "only GET requests to %s can be coalesced" % func.__name__
+            )
+
+            fields_tree = None
+
+            if fields:
+                response_model = stream_item or func_sig.return_annotation
+
+                assert isinstance(response_model, type) and issubclass(
+                    response_model, BaseModel
+                ), ("fields needs %s to return a model" % func.__name__)
+                assert "fields" not in func_sig.parameters, (
+                    "fields is used by the framework on %s" % func.__name__
+                )
+
+                # the paths that can be selected are worked out once, and each
+                # distinct ?fields= is compiled once
+                fields_tree = field_tree(response_model)
+                include_cache = LRUCache(maxsize=128)
+
+            if inspect.iscoroutinefunction(func):
+                assert stream_item is None, (
+                    "async handler %s can't stream its response" % func.__name__
+                )
+
+                # run on the shared event loop, the request thread waits for
+                # the result
+                def run_async(*args, **kwargs):
+                    return self.event_loop.run(func(*args, **kwargs))
+
+                call = run_async
+
+            else:
+                call = func
+
+            def _handle(timings, arguments, *args, **kwargs):
+                principal = None
+                include = None
                 status_code = None
                 response = None
                 process = False
+                streaming = False
+                cache_key = None
 
                 try:
-                    # TODO check api keys
-                    if body_class is not None:
-                        if request.content_type not in deserializers:
+                    # rejected before any of the request is read
+                    if requires_auth and self.authenticators:
+                        principal = self.authenticate()
+
+                    elif uses_principal:
+                        principal = self.authenticate(required=False)
+
+                    if body_binding is not None:
+                        mark = time.perf_counter()
+                        codec = self.request_codec()
+
+                        if codec is None:
                             raise BadRequestException(
                                 "Unknown content type %s" % (request.content_type)
                             )
 
-                        data = deserializers[request.content_type](request.data)
+                        if body_binding.stream:
+                            # items are decoded and validated as the handler
+                            # consumes them
+                            kwargs["body"] = body_binding.coerce(
+                                decode_body_stream(codec, request.stream)
+                            )
 
-                        # for now we simply ensure that everything that's
-                        # submitted is a dict, because we don't handle
-                        # anything else
-                        if not isinstance(data, dict):
-                            raise BadRequestException()
+                        elif codec.mime_type == "application/json":
+                            # pydantic-core parses and validates json in a
+                            # single pass, no intermediate python objects, so
+                            # it's all counted as decoding
+                            kwargs["body"] = body_binding.adapter.validate_json(
+                                request.get_data()
+                            )
 
-                        # validation failure will be caught below
-                        kwargs["body"] = body_class(**data)
+                        else:
+                            try:
+                                data = codec.decode(request.data)
 
-                    request_args = request.args.to_dict(flat=False)
+                            except Exception:
+                                raise BadRequestException(
+                                    "Unable to decode %s body" % (codec.mime_type)
+                                )
 
-                    for key, param in func_sig.parameters.items():
-                        if key not in kwargs:
-                            if key in request_args:
-                                # TODO handle coercion
-                                def default_handler(value):
-                                    return param.annotation(
-                                        value[0] if isinstance(value, list) else value
-                                    )
+                            timings["decode"] = time.perf_counter() - mark
+                            mark = time.perf_counter()
 
-                                handlers = {
-                                    List[str]: lambda value: (
-                                        value if isinstance(value, list) else [value]
-                                    ),
-                                }
+                            # validation failure will be caught below
+                            kwargs["body"] = body_binding.coerce(data)
 
-                                handler = handlers.get(
-                                    param.annotation, default_handler
-                                )
+                            timings["validate"] = time.perf_counter() - mark
 
-                                try:
-                                    kwargs[key] = handler(request_args[key])
+                        if "decode" not in timings:
+                            timings["decode"] = time.perf_counter() - mark
 
-                                except ValueError:
-                                    # FIXME this should return a more useful error message
-                                    raise BadRequestException(
-                                        'Invalid value for "%s"' % key
-                                    )
+                    if params_adapter is not None:
+                        mark = time.perf_counter()
 
-                            elif param.default:
-                                # FIXME this should really consider Ellipsis
-                                # fields that aren't provided as a bad request
-                                if isinstance(param.default, FieldInfo):
-                                    if param.default.default != Ellipsis:
-                                        kwargs[key] = param.default.default
+                        try:
+                            bind_params(
+                                params_adapter, param_bindings, request.args, kwargs
+                            )
 
-                                elif param.default not in (inspect._empty, Ellipsis):
-                                    kwargs[key] = param.default
+                        finally:
+                            timings["validate"] = (
+                                timings.get("validate", 0) + time.perf_counter() - mark
+                            )
+
+                        if arguments is not None:
+                            # the profile shows the query arguments too
+                            arguments.update(
+                                (b.name, kwargs[b.name])
+                                for b in param_bindings
+                                if b.name in kwargs
+                            )
+
+                    if fields_tree is not None:
+                        fields_spec = request.args.get("fields", "")
+                        include = include_cache.get(fields_spec, _missing)
+
+                        if include is _missing:
+                            # unknown fields are a bad request
+                            include = compile_include(fields_spec, fields_tree)
+                            include_cache.set(fields_spec, include)
+
+                    if principal_binding is not None:
+                        kwargs[principal_binding.name] = principal
 
                     process = True
 
@@ -547,9 +1476,134 @@ class FlaskFastAPI(Flask):
 
                     status_code = e.status_code
 
+                conditional = request.method in _conditional_methods and (
+                    version is not None
+                    or last_modified is not None
+                    or (self.etag_responses if etag is None else etag)
+                )
+                version_etag = None
+                modified = None
+
+                if process and (conditional or cache is not None or coalesce):
+                    param_kwargs = {
+                        b.name: kwargs[b.name]
+                        for b in param_bindings
+                        if b.name in kwargs
+                    }
+                    # parts of the key invalidate_cache doesn't know about
+                    variant = {}
+
+                    if fields_tree is not None:
+                        variant["fields"] = fields_spec
+
+                    if uses_principal:
+                        # responses may differ by caller
+                        variant["principal"] = principal
+
+                if process and conditional:
+                    # cheap checks that can skip all of the work
+                    if version is not None:
+                        version_etag = str(version(**param_kwargs))
+
+                    if last_modified is not None:
+                        modified = last_modified(**param_kwargs)
+
+                    if (version_etag or modified) and not is_resource_modified(
+                        request.environ, etag=version_etag, last_modified=modified
+                    ):
+                        return self.not_modified_response(version_etag, modified)
+
+                if process and cache is not None and "callback" not in request.args:
+                    cache_key = cache.make_key(
+                        endpoint,
+                        self.negotiate_codec().mime_type,
+                        param_kwargs,
+                        variant,
+                    )
+                    cached = cache.get(cache_key)
+
+                    if cached is not None:
+                        return self._stored_response(
+                            cached, conditional, version_etag, modified
+                        )
+
+                flight = None
+
+                if process and coalesce and "callback" not in request.args:
+                    flight_key = (
+                        endpoint,
+                        self.negotiate_codec().mime_type,
+                        default_cache_key({**param_kwargs, **variant}),
+                    )
+                    flight, leader = self.single_flight.join(flight_key)
+
+                    if leader:
+                        # landed once the response is ready, or in teardown if
+                        # something goes wrong before then
+                        g._flask_fastapi_flight = (flight_key, flight)
+
+                    else:
+                        try:
+                            # coalesce can be given as the seconds to wait
+                            shared = flight.wait(
+                                self.coalesce_timeout if coalesce is True else coalesce
+                            )
+
+                        except Exception:
+                            # already reported by the leader
+                            return self.serialize_response(
+                                HttpErrorResponse(
+                                    code=500,
+                                    name="Internal server error. Assume request failed. Please try again",
+                                ),
+                                500,
+                            )
+
+                        flight = None
+
+                        if shared is not None:
+                            return self._stored_response(
+                                shared, conditional, version_etag, modified
+                            )
+
+                        # the leader is taking too long, don't wait any more
+
+                background_tasks = None
+                after_response = None
+                teardown = None
+                projection = None
+
                 if process:
+                    mark = time.perf_counter()
+
+                    if background_binding is not None or (
+                        dependencies is not None and dependencies.background
+                    ):
+                        background_tasks = BackgroundTasks()
+
+                        if background_binding is not None:
+                            kwargs[background_binding.name] = background_tasks
+
                     try:
-                        response = func(*args, **kwargs)
+                        if dependencies is not None:
+                            teardown = ExitStack()
+                            dependencies.solve(
+                                self.dependency_scope,
+                                kwargs,
+                                {
+                                    ARGUMENT_BACKGROUND: background_tasks,
+                                    ARGUMENT_PRINCIPAL: principal,
+                                },
+                                teardown,
+                                self.event_loop.run,
+                            )
+
+                        response = call(*args, **kwargs)
+
+                        if stream_item is not None:
+                            response = prime_stream(response)
+                            streaming = True
+
                         status_code = (
                             response_code
                             or FlaskFastAPI.default_response_codes[request.method]
@@ -577,8 +1631,7 @@ class FlaskFastAPI(Flask):
                         # report error, but don't show the user
                         # TODO some sort of exception handler
                         # iterate over exception handlers and deliver to each
-                        for reporter in self.exception_reporters:
-                            reporter(self, e)
+                        self._report_exception(e)
 
                         response = HttpErrorResponse(
                             code=500,
@@ -587,11 +1640,130 @@ class FlaskFastAPI(Flask):
 
                         status_code = 500
 
-                return self.serialize_response(response, status_code)
+                    else:
+                        if background_tasks:
+                            # run once the response has been sent
+                            after_response = background_tasks
+
+                        # error responses are always sent in full
+                        projection = include
+
+                    timings["handler"] = time.perf_counter() - mark
+
+                mark = time.perf_counter()
+
+                if streaming:
+                    # the items are written after this returns, only the time
+                    # to start the response is counted
+                    response = self.stream_response(response, status_code, projection)
+                    timings["serialize"] = time.perf_counter() - mark
+
+                    if after_response is not None:
+                        self._run_after(response, after_response)
+
+                    if teardown is not None:
+                        response.call_on_close(teardown.close)
+
+                    return response
+
+                response = self.serialize_response(response, status_code, projection)
+
+                if response.status_code == 401 and self.authenticators:
+                    response.headers["WWW-Authenticate"] = challenge(
+                        self.authenticators
+                    )
+                timings["serialize"] = time.perf_counter() - mark
+
+                if flight is not None:
+                    g.pop("_flask_fastapi_flight", None)
+                    self.single_flight.land(flight_key, flight)
+                    flight.finish(
+                        CachedResponse(
+                            response.status_code,
+                            response.content_type,
+                            response.get_data(),
+                        )
+                    )
+
+                if after_response is not None:
+                    self._run_after(response, after_response)
+
+                if teardown is not None:
+                    # request scoped dependencies are closed once the
+                    # response has been sent
+                    response.call_on_close(teardown.close)
+
+                if cache_key is not None and 200 <= response.status_code < 300:
+                    cache.set(
+                        cache_key,
+                        CachedResponse(
+                            response.status_code,
+                            response.content_type,
+                            response.get_data(),
+                        ),
+                    )
+
+                if conditional and 200 <= response.status_code < 300:
+                    response = self.conditional_response(
+                        response, version_etag, modified
+                    )
+
+                return response
+
+            def _decorated(*args, **kwargs):
+                timings = {}
+                start = time.perf_counter()
+
+                if limiter is not None and not limiter.acquire():
+                    response = self.overloaded_response()
+                    self._record_timings(endpoint, response, timings, start)
+
+                    return response
+
+                try:
+                    if self.profiler is None:
+                        response = _handle(timings, None, *args, **kwargs)
+
+                    else:
+                        # filled in by _handle once they're validated
+                        arguments = dict(kwargs)
+
+                        with self.profiler.profile(
+                            endpoint, request.full_path, arguments, timings
+                        ):
+                            response = _handle(timings, arguments, *args, **kwargs)
+
+                except BaseException:
+                    if limiter is not None:
+                        limiter.release()
+
+                    raise
+
+                if limiter is not None:
+                    if response.is_streamed:
+                        # the work carries on while the body is sent
+                        response.call_on_close(limiter.release)
+
+                    else:
+                        limiter.release()
+
+                self._record_timings(endpoint, response, timings, start)
+
+                return response
+
+            _decorated.bindings = bindings
+            _decorated.signature = func_sig
 
             endpoint = func.__name__
             assert endpoint not in self.schema_metadata
 
+            limiter = None
+
+            if max_concurrency is not None:
+                limiter = self.concurrency_limits[endpoint] = ConcurrencyLimiter(
+                    max_concurrency, max_queue, self.queue_timeout
+                )
+
             if not private:
                 self.schema_metadata[endpoint] = {
                     "tags": tags,
@@ -600,11 +1772,16 @@ class FlaskFastAPI(Flask):
                     "doc": func.__doc__,
                     "response_code": response_code,
                     "requires_auth": requires_auth,
+                    "parameters": parameters,
+                    "fields": fields,
                 }
 
                 if body_class is not None:
                     self.schema_metadata[endpoint]["body"] = body_class
 
+            if cache is not None:
+                self.response_caches[endpoint] = (cache, param_bindings)
+
             self.add_url_rule(
                 rule,
                 endpoint,
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+    """Bounds the requests an endpoint handles at once.
+
+    Up to ``max_concurrency`` requests run, up to ``max_queue`` more wait
+    for a slot for at most ``queue_timeout`` seconds, and anything beyond
+    that is turned away.
+    """
+
+    def __init__(self, max_concurrency, max_queue=0, queue_timeout=5.0):
+        assert max_concurrency > 0, "max_concurrency must be at least 1"
+
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, ``False`` if the request should be rejected."""
+
+        with self._condition:
+            if self.active < self.max_concurrency and not self.queued:
+                self.active += 1
+                self.admitted += 1
+
+                return True
+
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+
+                return False
+
+            self.queued += 1
+
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self.active < self.max_concurrency, self.queue_timeout
+                )
+
+            finally:
+                self.queued -= 1
+
+            if not admitted:
+                self.rejected += 1
+                self.timed_out += 1
+
+                return False
+
+            self.active += 1
+            self.admitted += 1
+
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+def render_prometheus(limiters, prefix="flask_fastapi"):
+    """Gauges and counters for each endpoint's limiter."""
+
+    lines = []
+
+    for name, kind, help_text in (
+        ("active", "gauge", "Requests being handled."),
+        ("queued", "gauge", "Requests waiting for a concurrency slot."),
+        ("rejected", "counter", "Requests rejected with a 503."),
+    ):
+        metric = "%s_concurrency_%s" % (prefix, name)
+
+        if kind == "counter":
+            metric += "_total"
+
+        lines.append("# HELP %s %s" % (metric, help_text))
+        lines.append("# TYPE %s %s" % (metric, kind))
+
+        for endpoint, limiter in sorted(limiters.items()):
+            lines.append(
+                '%s{endpoint="%s"} %d' % (metric, endpoint, getattr(limiter, name))
+            )
+
+    return "\n".join(lines) + "\n"
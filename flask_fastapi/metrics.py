@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+from collections import Counter
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# phases of a request, in the order they happen
+phases = ("decode", "validate", "handler", "serialize", "total")
+
+# seconds, as the prometheus client libraries use
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def server_timing(timings):
+    """Format phase timings, in seconds, as a ``Server-Timing`` header."""
+
+    return ", ".join(
+        "%s;dur=%.3f" % (phase, seconds * 1000) for phase, seconds in timings.items()
+    )
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one slot per bucket plus +Inf, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+
+        for count in self.counts:
+            total += count
+
+            yield total
+
+
+class Metrics:
+    """Per endpoint latency histograms and request counters.
+
+    Assign an instance to ``FlaskFastAPI.metrics`` to have every request
+    recorded. Each phase of a request (decoding the body, validating the
+    parameters, the handler and serializing the response) gets its own
+    histogram, as does the total. Counts are per process.
+    """
+
+    def __init__(self, buckets=default_buckets, prefix="flask_fastapi"):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+
+        self._histograms = {}
+        self._requests = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, status, timings):
+        with self._lock:
+            self._requests[(endpoint, status)] += 1
+
+            for phase, seconds in timings.items():
+                histogram = self._histograms.get((endpoint, phase))
+
+                if histogram is None:
+                    histogram = self._histograms[(endpoint, phase)] = Histogram(
+                        self.buckets
+                    )
+
+                histogram.observe(seconds)
+
+    def requests(self, endpoint=None):
+        with self._lock:
+            return sum(
+                count
+                for (name, _), count in self._requests.items()
+                if endpoint is None or name == endpoint
+            )
+
+    def histogram(self, endpoint, phase="total"):
+        return self._histograms.get((endpoint, phase))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render_prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+
+        duration = self.prefix + "_request_duration_seconds"
+        requests = self.prefix + "_requests_total"
+        bounds = ["%g" % bound for bound in self.buckets] + ["+Inf"]
+
+        lines = [
+            "# HELP %s Time spent in each phase of handling a request." % duration,
+            "# TYPE %s histogram" % duration,
+        ]
+
+        with self._lock:
+            for (endpoint, phase), histogram in sorted(self._histograms.items()):
+                labels = 'endpoint="%s",phase="%s"' % (_label(endpoint), phase)
+
+                for bound, count in zip(bounds, histogram.cumulative()):
+                    lines.append(
+                        '%s_bucket{%s,le="%s"} %d' % (duration, labels, bound, count)
+                    )
+
+                lines.append("%s_sum{%s} %r" % (duration, labels, histogram.sum))
+                lines.append("%s_count{%s} %d" % (duration, labels, histogram.count))
+
+            lines.append("# HELP %s Requests handled." % requests)
+            lines.append("# TYPE %s counter" % requests)
+
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(
+                    '%s{endpoint="%s",status="%d"} %d'
+                    % (requests, _label(endpoint), status, count)
+                )
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Dict, NamedTuple
+
+from .utils import PerProcess
+
+import io
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Profile(NamedTuple):
+    endpoint: str
+    url: str
+    arguments: Dict[str, Any]
+    timings: Dict[str, float]
+    started: float
+    # "cprofile" for sampled requests, "stack" for requests caught by the
+    # latency threshold
+    kind: str
+    profile: str
+
+    def to_dict(self):
+        return {
+            **self._asdict(),
+            "arguments": {name: repr(value) for name, value in self.arguments.items()},
+        }
+
+
+def _frame_name(frame):
+    code = frame.f_code
+
+    return "%s:%s" % (os.path.basename(code.co_filename), code.co_qualname)
+
+
+def _collapse(frame):
+    # root first, in the format flamegraph tools read
+    names = []
+
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of threads that have run past a deadline.
+
+    A single background thread does the sampling, and only wakes while a
+    watched request is in flight, so requests that finish in time cost a
+    couple of lock acquisitions.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._process = PerProcess(self._start)
+
+    def _start(self):
+        self._active = {}
+        self._condition = threading.Condition()
+
+        threading.Thread(
+            target=self._run,
+            args=(self._condition, self._active),
+            name="flask-fastapi-profiler",
+            daemon=True,
+        ).start()
+
+    def watch(self, thread_id, deadline):
+        self._process.ensure()
+
+        stacks = Counter()
+
+        with self._condition:
+            self._active[thread_id] = (deadline, stacks)
+            self._condition.notify()
+
+        return stacks
+
+    def unwatch(self, thread_id):
+        with self._condition:
+            self._active.pop(thread_id, None)
+
+    def _run(self, condition, active):
+        with condition:
+            while True:
+                if not active:
+                    condition.wait()
+
+                    continue
+
+                now = time.perf_counter()
+                due = [
+                    (thread_id, stacks)
+                    for thread_id, (deadline, stacks) in active.items()
+                    if deadline <= now
+                ]
+
+                if due:
+                    frames = sys._current_frames()
+
+                    for thread_id, stacks in due:
+                        frame = frames.get(thread_id)
+
+                        if frame is not None:
+                            stacks[_collapse(frame)] += 1
+
+                    timeout = self.interval
+
+                else:
+                    timeout = min(deadline for deadline, _ in active.values()) - now
+
+                condition.wait(timeout)
+
+
+class Profiler:
+    """Captures profiles of slow and sampled requests.
+
+    Assign an instance to ``FlaskFastAPI.profiler``. A ``sample_rate``
+    fraction of requests are run under cProfile. Any other request that
+    takes longer than ``threshold`` seconds has its stack sampled every
+    ``interval`` seconds from then until it completes. The most recent
+    ``max_profiles`` profiles are kept.
+    """
+
+    def __init__(self, threshold=1.0, sample_rate=0.0, max_profiles=50, interval=0.005):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.stats_limit = 40
+        self.sampler = StackSampler(interval)
+
+        self._profiles = deque(maxlen=max_profiles)
+
+    def profiles(self):
+        return list(self._profiles)
+
+    def clear(self):
+        self._profiles.clear()
+
+    def _start_cprofile(self):
+        import cProfile
+
+        profile = cProfile.Profile()
+
+        try:
+            profile.enable()
+
+        except ValueError:
+            # only one profiler can be active at a time, e.g. another thread
+            # is already being sampled
+            return None
+
+        return profile
+
+    def _format_cprofile(self, profile):
+        import pstats
+
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats("cumulative").print_stats(self.stats_limit)
+
+        return output.getvalue()
+
+    @contextmanager
+    def profile(self, endpoint, url, arguments, timings):
+        """Profile the request handled inside the block, if it qualifies."""
+
+        start = time.perf_counter()
+        cprofile = None
+        stacks = None
+        thread_id = threading.get_ident()
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            cprofile = self._start_cprofile()
+
+        if cprofile is None and self.threshold is not None:
+            stacks = self.sampler.watch(thread_id, start + self.threshold)
+
+        try:
+            yield
+
+        finally:
+            duration = time.perf_counter() - start
+
+            if cprofile is not None:
+                cprofile.disable()
+
+            if stacks is not None:
+                self.sampler.unwatch(thread_id)
+
+            if cprofile is not None:
+                kind, text = "cprofile", self._format_cprofile(cprofile)
+
+            elif stacks is not None and duration >= self.threshold:
+                kind = "stack"
+                text = "\n".join(
+                    "%s %d" % (stack, count) for stack, count in stacks.most_common()
+                )
+
+            else:
+                kind = None
+
+            if kind is not None:
+                self._profiles.append(
+                    Profile(
+                        endpoint=endpoint,
+                        url=url,
+                        arguments=arguments,
+                        timings={**timings, "total": duration},
+                        started=time.time() - duration,
+                        kind=kind,
+                        profile=text,
+                    )
+                )
+
+                logger.info(
+                    "captured %s profile of %s, %.3fs", kind, endpoint, duration
+                )
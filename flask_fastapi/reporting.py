@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from contextlib import nullcontext
+from flask import has_request_context, request
+
+from .utils import PerProcess
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(e):
+    """Identify an exception by its type and where it was raised.
+
+    The message is left out, it often includes ids that would otherwise
+    make every occurrence unique.
+    """
+
+    parts = [type(e).__module__, type(e).__qualname__]
+    tb = e.__traceback__
+
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        parts.append("%s:%s:%d" % (code.co_filename, code.co_name, tb.tb_lineno))
+        tb = tb.tb_next
+
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ReportedException:
+    """An exception waiting to be reported, with how often it happened."""
+
+    __slots__ = (
+        "exception",
+        "fingerprint",
+        "method",
+        "url",
+        "count",
+        "first_seen",
+        "last_seen",
+    )
+
+    def __init__(self, exception, fingerprint, method, url):
+        self.exception = exception
+        self.fingerprint = fingerprint
+        self.method = method
+        self.url = url
+        self.count = 1
+        self.first_seen = self.last_seen = time.time()
+
+    def __repr__(self):
+        return "<ReportedException %r x%d>" % (self.exception, self.count)
+
+
+class ExceptionDispatcher:
+    """Delivers exceptions to the app's reporters from a background thread.
+
+    Exceptions are queued rather than reported on the request path. While
+    queued, repeats of the same exception (by ``fingerprint``) are counted
+    rather than queued again, and the worker delivers them in batches of up
+    to ``batch_size``, waiting up to ``interval`` seconds for a batch to
+    fill. Once ``max_queue`` distinct exceptions are waiting, ``drop``
+    decides whether the ``"newest"`` or the ``"oldest"`` is discarded.
+    """
+
+    def __init__(self, app, max_queue=1000, batch_size=50, interval=1.0, drop="newest"):
+        assert drop in ("newest", "oldest"), "drop must be newest or oldest"
+
+        self.app = app
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.drop = drop
+
+        self.delivered = 0
+        self.dropped = 0
+        self.deduplicated = 0
+
+        self._process = PerProcess(self._start)
+        self._registered = False
+
+    def _start(self):
+        if not self._registered:
+            # inherited by forked workers
+            atexit.register(self.flush)
+            self._registered = True
+
+        # anything queued before a fork is the parent's to deliver
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._flushing = 0
+        self._condition = threading.Condition()
+
+        threading.Thread(
+            target=self._run,
+            args=(self._condition,),
+            name="flask-fastapi-reporter",
+            daemon=True,
+        ).start()
+
+    def stats(self):
+        return {
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "deduplicated": self.deduplicated,
+            "queued": len(self._pending) if self._process.started else 0,
+        }
+
+    def submit(self, e):
+        """Queue ``e`` for the reporters, ``False`` if it had to be dropped."""
+
+        self._process.ensure()
+
+        key = fingerprint(e)
+        method = url = None
+
+        if has_request_context():
+            method, url = request.method, request.full_path
+
+        with self._condition:
+            event = self._pending.get(key)
+
+            if event is not None:
+                event.count += 1
+                event.last_seen = time.time()
+                self.deduplicated += 1
+
+                return True
+
+            if len(self._pending) >= self.max_queue:
+                if self.drop == "newest":
+                    self.dropped += 1
+
+                    return False
+
+                _, oldest = self._pending.popitem(last=False)
+                self.dropped += oldest.count
+
+            self._pending[key] = ReportedException(e, key, method, url)
+
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+        return True
+
+    def flush(self, timeout=5.0):
+        """Wait for everything queued to be delivered, ``False`` on timeout."""
+
+        if not self._process.started:
+            return True
+
+        with self._condition:
+            if not self._pending and not self._in_flight:
+                return True
+
+            self._flushing += 1
+            self._condition.notify_all()
+
+            try:
+                return self._condition.wait_for(
+                    lambda: not self._pending and not self._in_flight, timeout
+                )
+
+            finally:
+                self._flushing -= 1
+
+    def _run(self, condition):
+        while True:
+            with condition:
+                while not self._pending:
+                    condition.wait()
+
+                # give a burst of errors the chance to collect into one batch
+                if len(self._pending) < self.batch_size and not self._flushing:
+                    condition.wait(self.interval)
+
+                batch = [
+                    self._pending.popitem(last=False)[1]
+                    for _ in range(min(self.batch_size, len(self._pending)))
+                ]
+                self._in_flight = len(batch)
+
+            try:
+                with self.app.app_context():
+                    self._deliver(batch)
+
+            finally:
+                with condition:
+                    self._in_flight = 0
+                    self.delivered += len(batch)
+                    condition.notify_all()
+
+    def _deliver(self, batch):
+        for reporter in self.app.batch_exception_reporters:
+            try:
+                reporter(self.app, batch)
+
+            except Exception:
+                logger.exception("exception reporter %r failed", reporter)
+
+        for event in batch:
+            context = nullcontext()
+
+            if event.url is not None:
+                # the request is long gone, reporters that look at it get its
+                # method, path and query, but not its headers or body
+                context = self.app.test_request_context(event.url, method=event.method)
+
+            with context:
+                for reporter in self.app.exception_reporters:
+                    try:
+                        reporter(self.app, event.exception)
+
+                    except Exception:
+                        logger.exception("exception reporter %r failed", reporter)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from typing import List, Optional
+from typing import List, Optional, Union
 from pydantic import BaseModel
 import logging
 
@@ -14,7 +14,7 @@ class HttpErrorResponse(BaseModel):
 
 
 class ValidationError(BaseModel):
-    loc: List[str]
+    loc: List[Union[str, int]]
     msg: str
     type: str
 
@@ -22,4 +22,4 @@ class ValidationError(BaseModel):
 class ValidationErrorResponse(BaseModel):
     code: int
     name: str
-    errors: Optional[List[ValidationError]]
+    errors: Optional[List[ValidationError]] = None
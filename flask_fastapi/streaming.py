@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+from pydantic import ValidationError
+from typing import get_args, get_origin
+
+from .exceptions import BadRequestException
+
+import collections.abc
+import itertools
+import logging
+import orjson
+import re
+
+logger = logging.getLogger(__name__)
+
+_stream_origins = (
+    collections.abc.Iterator,
+    collections.abc.Iterable,
+    collections.abc.Generator,
+)
+
+
+def stream_item_type(annotation):
+    """Return the item type of an ``Iterator[Model]`` style annotation.
+
+    ``None`` is returned for anything that isn't a stream of items.
+    """
+
+    if get_origin(annotation) in _stream_origins:
+        args = get_args(annotation)
+
+        if args:
+            return args[0]
+
+    return None
+
+
+def prime_stream(items):
+    """Pull the first item out of ``items`` straight away.
+
+    Generator handlers don't run until they are iterated, so this makes
+    sure that anything raised before the first item (not found, bad request,
+    etc) happens while a proper error response can still be sent.
+    """
+
+    iterator = iter(items)
+
+    try:
+        first = next(iterator)
+
+    except StopIteration:
+        return iter(())
+
+    return itertools.chain((first,), iterator)
+
+
+def buffer_chunks(chunks, size):
+    """Join small chunks together so each write to the client is ~``size``."""
+
+    buffer = []
+    buffered = 0
+
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+
+        if buffered >= size:
+            yield b"".join(buffer)
+
+            buffer = []
+            buffered = 0
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_ndjson(stream, chunk_size=64 * 1024):
+    """Lazily decode newline delimited json read from a file-like object."""
+
+    pending = b""
+
+    while True:
+        chunk = stream.read(chunk_size)
+
+        if not chunk:
+            break
+
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+
+        for line in lines:
+            if line.strip():
+                yield orjson.loads(line)
+
+    if pending.strip():
+        yield orjson.loads(pending)
+
+
+# the only bytes that matter when finding the boundaries between items
+_json_structural = re.compile(rb'[\[\]{}",\\]')
+
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    """Lazily decode the items of a top level json array.
+
+    Only item boundaries are found here, each item is then handed to orjson
+    as a whole, so at most one item is held in memory at a time.
+    """
+
+    buffer = b""
+    pos = 0
+    start = None
+    depth = 0
+    in_string = False
+    finished = False
+    separated = False
+
+    while not finished:
+        chunk = stream.read(chunk_size)
+
+        if not chunk:
+            break
+
+        buffer += chunk
+
+        while True:
+            match = _json_structural.search(buffer, pos)
+
+            if match is None:
+                # keep pos if it is past the end waiting on an escaped byte
+                pos = max(pos, len(buffer))
+                break
+
+            char = match.group()
+            pos = match.end()
+
+            if in_string:
+                if char == b"\\":
+                    # skip whatever is escaped, which may be in the next chunk
+                    pos += 1
+
+                elif char == b'"':
+                    in_string = False
+
+            elif char == b'"':
+                in_string = True
+
+            elif char in b"[{":
+                if depth == 0:
+                    if char != b"[" or buffer[: match.start()].strip():
+                        raise ValueError("Expected a json array")
+
+                    start = pos
+
+                depth += 1
+
+            elif char in b"]}":
+                depth -= 1
+
+                if depth == 0:
+                    item = buffer[start : match.start()]
+
+                    if item.strip():
+                        yield orjson.loads(item)
+
+                    elif separated:
+                        raise ValueError("Trailing comma in json array")
+
+                    finished = True
+                    break
+
+            elif char == b"," and depth == 1:
+                # the end of one item and the start of the next
+                yield orjson.loads(buffer[start : match.start()])
+
+                start = pos
+                separated = True
+
+        # drop everything that has already been handed out
+        if start:
+            buffer = buffer[start:]
+            pos -= start
+            start = 0
+
+    if not finished:
+        raise ValueError("Unexpected end of json array")
+
+
+def validate_stream(items, adapter):
+    """Validate each decoded item with a ``TypeAdapter`` as it is consumed.
+
+    Validation errors are raised with the item's index at the start of
+    their location so that clients can find the offending item.
+    """
+
+    iterator = iter(items)
+    index = 0
+
+    while True:
+        try:
+            item = next(iterator)
+
+        except StopIteration:
+            return
+
+        except ValueError:
+            raise BadRequestException("Invalid item %d in request body" % index)
+
+        try:
+            yield adapter.validate_python(item)
+
+        except ValidationError as e:
+            errors = [
+                {**error, "loc": (index, *error["loc"])}
+                for error in e.errors(include_url=False)
+            ]
+
+            try:
+                error = ValidationError.from_exception_data(e.title, errors)
+
+            except Exception:
+                # custom error types can't always be rebuilt
+                raise e
+
+            raise error from None
+
+        index += 1
+
+
+def decode_body_stream(codec, stream):
+    """Iterate the decoded items of a request body read from ``stream``.
+
+    Codecs that can't decode incrementally fall back to decoding the whole
+    body, which then has to be a list.
+    """
+
+    if codec.decode_stream is not None:
+        return codec.decode_stream(stream)
+
+    try:
+        data = codec.decode(stream.read())
+
+    except Exception:
+        raise BadRequestException("Unable to decode %s body" % codec.mime_type)
+
+    if not isinstance(data, list):
+        raise BadRequestException()
+
+    return iter(data)
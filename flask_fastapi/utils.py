@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import importlib.util
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def module_available(module):
+    # checked without importing, optional modules are only loaded when used
+    return importlib.util.find_spec(module) is not None
+
+
+class PerProcess:
+    """Runs ``start`` once in each process, the first time it's needed.
+
+    Threads, pools and event loops don't survive a fork, so a forked worker
+    has to start its own rather than use its parent's. ``start`` runs under
+    a lock, and the process only counts as started once it has returned.
+    """
+
+    def __init__(self, start):
+        self._start = start
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._pid == os.getpid()
+
+    def ensure(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+                    self._pid = os.getpid()
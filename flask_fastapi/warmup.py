@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from pydantic import BaseModel
+from typing import NamedTuple, get_args
+
+import logging
+import os
+import resource
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupReport(NamedTuple):
+    endpoints: int
+    seconds: float
+    rss_before: int
+    rss_after: int
+    frozen_objects: int
+
+    @property
+    def rss_growth(self):
+        return self.rss_after - self.rss_before
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError):
+        # peak rather than current, but the best that's available. kilobytes
+        # on linux, bytes on macos
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def annotation_models(annotation):
+    """Every pydantic model referenced by a type hint."""
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        yield annotation
+
+    for arg in get_args(annotation):
+        yield from annotation_models(arg)
@@ -4,12 +4,16 @@ from setuptools import setup
 setup(
     name="Flask-FastAPI",
     install_requires=[
-        "Flask >= 1.1.2, < 2.0",
-        "Pydantic >= 1.7.3",
-        "orjson >= 3.4.6",
-        "PyYAML >= 5.4",
+        "Flask >= 3.0.3, < 4.0",
+        "Pydantic >= 2.7.3, < 3.0",
+        "orjson >= 3.10.3, < 4.0",
+        "PyYAML >= 6.0.1, < 7.0",
     ],
     extras_require={
+        "msgpack": ["msgpack >= 1.0.8, < 2.0"],
+        "cbor": ["cbor2 >= 5.6.4, < 6.0"],
+        "brotli": ["brotli >= 1.1.0, < 2.0"],
+        "zstd": ["zstandard >= 0.22.0, < 0.23"],
     },
     #data_files=[
     #    ('flask_fastapi', ['templates/*.html']),
@@ -1,4 +1,1343 @@
-from flask_fastapi import FlaskFastAPI
+from collections import Counter
+from flask import request
+from flask_fastapi import (
+    BadRequestException,
+    FlaskFastAPI,
+    ResponseCache,
+    SQLiteCacheBackend,
+)
+from pydantic import BaseModel, Field
+from datetime import date, datetime
+from enum import Enum
+from typing import Iterator, List, Optional
+from uuid import UUID
+
+import base64
+import gc
+import orjson
+import os
+import pytest
+import subprocess
+import sys
+import time
+
+
+class Item(BaseModel):
+    name: str
+    count: int = 0
+
+
+class Colour(str, Enum):
+    RED = "red"
+    BLUE = "blue"
+
+
+class ItemList(BaseModel):
+    items: List[Item]
+
+
+@pytest.fixture
+def api(tmp_path):
+    api = FlaskFastAPI(__name__, "Test API", "1.0.0")
+    api.calls = Counter()
+
+    @api.get("/catalog/<int:item_id>", cache=ResponseCache(ttl=60))
+    def catalog(item_id: int, detail: bool = False) -> Item:
+        api.calls["catalog"] += 1
+
+        return Item(name="catalog %s" % detail, count=item_id)
+
+    @api.get("/tagged/<int:item_id>", etag=True)
+    def tagged(item_id: int) -> Item:
+        api.calls["tagged"] += 1
+
+        return Item(name="tagged", count=item_id)
+
+    @api.get(
+        "/versioned/<int:item_id>",
+        version=lambda item_id: "v%d" % item_id,
+        last_modified=lambda item_id: datetime(2024, 1, item_id),
+    )
+    def versioned(item_id: int) -> Item:
+        api.calls["versioned"] += 1
+
+        return Item(name="versioned", count=item_id)
+
+    @api.get(
+        "/shared/<int:item_id>",
+        cache=ResponseCache(
+            ttl=60, backend=SQLiteCacheBackend(str(tmp_path / "cache.db"))
+        ),
+    )
+    def shared(item_id: int) -> Item:
+        api.calls["shared"] += 1
+
+        return Item(name="shared", count=item_id)
+
+    @api.get("/items/<int:item_id>")
+    def get_item(
+        item_id: int,
+        name: str = Field("widget", description="Item name"),
+        count: int = 1,
+    ) -> Item:
+        return Item(name="%s-%d" % (name, item_id), count=count)
+
+    @api.get("/search")
+    def search(q: str, tags: List[str] = []) -> ItemList:
+        return ItemList(items=[Item(name=q + tag) for tag in tags])
+
+    @api.get("/export")
+    def export(count: int) -> Iterator[Item]:
+        if count < 0:
+            raise BadRequestException()
+
+        for i in range(count):
+            yield Item(name="item", count=i)
+
+    @api.get("/filter/<uuid:owner>")
+    def filter_items(
+        owner: UUID,
+        ids: List[int] = Field(..., description="Item ids"),
+        colour: Optional[Colour] = None,
+        since: Optional[date] = None,
+        limit: int = Field(10, gt=0, le=100),
+    ) -> ItemList:
+        return ItemList(
+            items=[
+                Item(name="%s %s %s %s" % (owner, colour, since, limit), count=i)
+                for i in ids
+            ]
+        )
+
+    @api.post("/items/bulk")
+    def ingest(body: Iterator[Item]) -> ItemList:
+        return ItemList(items=list(body))
+
+    @api.put("/items")
+    def upsert_items(body: List[Item]) -> ItemList:
+        return ItemList(items=body)
+
+    @api.post("/items")
+    def create_item(body: Item) -> Item:
+        return body
+
+    return api
+
+
+@pytest.fixture
+def client(api):
+    return api.test_client()
+
 
 def test_null():
     pass
+
+
+def test_binding_plan_is_compiled(api):
+    from flask_fastapi.constants import ParamSource
+
+    bindings = {b.name: b for b in api.view_functions["get_item"].bindings}
+
+    assert bindings["item_id"].source == ParamSource.PATH
+    assert bindings["name"].source == ParamSource.QUERY
+    assert bindings["name"].default == "widget"
+    assert not bindings["name"].required
+    assert bindings["count"].default == 1
+
+
+def test_query_binding(client):
+    response = client.get("/items/3?name=bolt&count=7")
+
+    assert response.status_code == 200
+    assert response.json == {"name": "bolt-3", "count": 7}
+
+    response = client.get("/items/3")
+
+    assert response.json == {"name": "widget-3", "count": 1}
+
+
+def test_query_binding_list_and_required(client):
+    response = client.get("/search?q=a&tags=x&tags=y")
+
+    assert response.json == {
+        "items": [{"name": "ax", "count": 0}, {"name": "ay", "count": 0}]
+    }
+
+    assert client.get("/search").status_code == 400
+    assert client.get("/items/3?count=lots").status_code == 400
+
+
+def test_body_binding(client):
+    response = client.post("/items", json={"name": "nut", "count": 2})
+
+    assert response.status_code == 201
+    assert response.json == {"name": "nut", "count": 2}
+
+    assert client.post("/items", json={"count": 2}).status_code == 400
+    assert client.post("/items", json=[1, 2]).status_code == 400
+
+
+def test_openapi(client):
+    spec = client.get("/openapi.json").json
+
+    assert "/items/{item_id}" in spec["paths"]
+    assert "Item" in spec["components"]["schemas"]
+
+
+def test_openapi_cached_with_etag(api, client):
+    response = client.get("/openapi.json")
+    etag = response.headers["ETag"]
+
+    assert response.json["servers"] == [{"url": "/"}]
+    assert api._openapi_spec is not None
+
+    response = client.get("/openapi.json", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get("/openapi.yaml")
+
+    assert response.mimetype == "application/x-yaml"
+    assert response.headers["ETag"] != etag
+
+
+def test_openapi_invalidated_by_new_route(api):
+    assert "/extra" not in api.openapi()["paths"]
+
+    @api.get("/extra")
+    def extra() -> Item:
+        return Item(name="extra")
+
+    assert "/extra" in api.openapi()["paths"]
+
+
+def test_serialize_response_formats(client):
+    response = client.get("/items/1", headers={"Accept": "application/x-yaml"})
+
+    assert response.content_type == "application/x-yaml"
+    assert response.data == b"count: 1\nname: widget-1\n"
+
+    response = client.get("/items/1?callback=cb")
+
+    assert response.data == b'cb({"name":"widget-1","count":1})'
+
+
+def test_binary_codecs(client):
+    import cbor2
+    import msgpack
+
+    response = client.get("/items/2", headers={"Accept": "application/msgpack"})
+
+    assert response.content_type == "application/msgpack"
+    assert msgpack.unpackb(response.data) == {"name": "widget-2", "count": 1}
+
+    response = client.post(
+        "/items",
+        data=cbor2.dumps({"name": "cog", "count": 3}),
+        content_type="application/cbor",
+        headers={"Accept": "application/cbor"},
+    )
+
+    assert cbor2.loads(response.data) == {"name": "cog", "count": 3}
+
+    response = client.post("/items", data=b"\xc1", content_type="application/msgpack")
+
+    assert response.status_code == 400
+
+
+def test_register_codec(api):
+    from flask_fastapi import Codec
+
+    api.register_codec(Codec("text/plain", lambda model: repr(model).encode()))
+
+    spec = api.openapi()
+    accept = spec["paths"]["/search"]["get"]["parameters"][0]
+
+    assert "text/plain" in accept["schema"]["enum"]
+
+    with api.test_client() as client:
+        response = client.get("/items/1", headers={"Accept": "text/plain"})
+
+    assert response.data == b"Item(name='widget-1', count=1)"
+
+    with api.test_client() as client:
+        # negotiated once, then remembered
+        client.get("/items/1", headers={"Accept": "application/x-yaml"})
+        api.unregister_codec("application/x-yaml")
+        response = client.get("/items/1", headers={"Accept": "application/x-yaml"})
+
+    assert response.content_type == "application/json"
+    assert (
+        "application/x-yaml"
+        not in api.openapi()["paths"]["/search"]["get"]["parameters"][0]["schema"][
+            "enum"
+        ]
+    )
+
+
+def test_streaming_response(client):
+    response = client.get("/export?count=3")
+
+    assert response.is_streamed
+    assert response.json == [
+        {"name": "item", "count": 0},
+        {"name": "item", "count": 1},
+        {"name": "item", "count": 2},
+    ]
+
+    response = client.get("/export?count=2", headers={"Accept": "application/x-ndjson"})
+
+    assert response.content_type == "application/x-ndjson"
+    assert response.data == (b'{"name":"item","count":0}\n{"name":"item","count":1}\n')
+
+    assert client.get("/export?count=0").json == []
+    assert client.get("/export?count=-1").status_code == 400
+
+
+def test_streaming_response_failure(api, client):
+    @api.get("/broken_export")
+    def broken_export() -> Iterator[Item]:
+        for i in range(5):
+            if i == 3:
+                raise RuntimeError("backend went away")
+
+            yield Item(name="item", count=i)
+
+    reported = []
+    api.register_exception_reporter(lambda app, e: reported.append(e))
+
+    # the error reaches the server, which cuts the body off rather than it
+    # being closed off as if it were complete
+    with pytest.raises(RuntimeError):
+        client.get("/broken_export").get_data()
+
+    assert api.exception_dispatcher.flush()
+    assert [type(e) for e in reported] == [RuntimeError]
+
+
+def test_streaming_openapi(api):
+    content = api.openapi()["paths"]["/export"]["get"]["responses"]["200"]["content"]
+
+    assert content["application/json"]["schema"]["type"] == "array"
+    assert content["application/x-ndjson"]["schema"] == {
+        "$ref": "#/components/schemas/Item"
+    }
+
+
+def test_json_array_reader():
+    from flask_fastapi.streaming import iter_json_array
+
+    import io
+
+    data = b' [ {"a": "x,]\\"}", "b": [1, {"c": 2}]}, 3 , "s\\\\" ,null] '
+
+    for chunk_size in (1, 2, 7, 1024):
+        items = list(iter_json_array(io.BytesIO(data), chunk_size))
+
+        assert items == [{"a": 'x,]"}', "b": [1, {"c": 2}]}, 3, "s\\", None]
+
+    assert list(iter_json_array(io.BytesIO(b"[]"))) == []
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b'{"a": 1}')))
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b"[1, 2")))
+
+    for data in (b'[{"name": "a"},]', b"[1, 2 , ]", b"[,]", b"[1,,2]"):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.BytesIO(data)))
+
+
+def test_streaming_request_body(client):
+    items = [{"name": "a"}, {"name": "b", "count": 2}]
+
+    response = client.post("/items/bulk", json=items)
+
+    assert response.status_code == 201
+    assert response.json == {
+        "items": [{"name": "a", "count": 0}, {"name": "b", "count": 2}]
+    }
+
+    response = client.post(
+        "/items/bulk",
+        data=b'{"name": "a"}\n{"name": "b"}\n',
+        content_type="application/x-ndjson",
+    )
+
+    assert len(response.json["items"]) == 2
+
+    response = client.post("/items/bulk", json=[{"name": "a"}, {"count": 1}])
+
+    assert response.status_code == 400
+    assert response.json["errors"][0]["loc"] == [1, "name"]
+
+    response = client.post(
+        "/items/bulk", data=b'[{"name": "a"},]', content_type="application/json"
+    )
+
+    assert response.status_code == 400
+
+
+def test_list_request_body(api, client):
+    response = client.put("/items", json=[{"name": "a"}, {"name": "b"}])
+
+    assert response.status_code == 202
+    assert [item["name"] for item in response.json["items"]] == ["a", "b"]
+
+    response = client.put(
+        "/items",
+        data=b"- name: a\n- name: b\n  count: 3\n",
+        content_type="application/x-yaml",
+    )
+
+    assert response.json["items"][1] == {"name": "b", "count": 3}
+
+    response = client.put("/items", json=[{"name": "a"}, {"count": "x"}])
+
+    assert response.status_code == 400
+    assert [error["loc"] for error in response.json["errors"]] == [
+        [1, "name"],
+        [1, "count"],
+    ]
+
+    assert (
+        client.put("/items", data=b"[{", content_type="application/json").status_code
+        == 400
+    )
+
+    body = api.openapi()["paths"]["/items"]["put"]["requestBody"]
+    schema = body["content"]["application/json"]["schema"]
+
+    assert schema["type"] == "array"
+    assert schema["items"] == {"$ref": "#/components/schemas/Item"}
+
+
+def test_query_validation(api, client):
+    owner = "12345678-1234-5678-1234-567812345678"
+
+    response = client.get(
+        "/filter/%s?ids=1&ids=2&colour=red&since=2024-01-31&limit=5" % owner
+    )
+
+    assert response.status_code == 200
+    assert response.json["items"] == [
+        {"name": "%s Colour.RED 2024-01-31 5" % owner, "count": 1},
+        {"name": "%s Colour.RED 2024-01-31 5" % owner, "count": 2},
+    ]
+
+    response = client.get("/filter/%s?colour=green&limit=0" % owner)
+
+    assert response.status_code == 400
+    assert sorted(error["loc"][0] for error in response.json["errors"]) == [
+        "colour",
+        "ids",
+        "limit",
+    ]
+
+    parameters = {
+        parameter["name"]: parameter
+        for parameter in api.openapi()["paths"]["/filter/{owner}"]["get"]["parameters"]
+    }
+
+    assert parameters["ids"]["required"]
+    assert parameters["ids"]["schema"] == {
+        "type": "array",
+        "items": {"type": "integer"},
+    }
+    assert parameters["owner"]["schema"] == {"type": "string", "format": "uuid"}
+    assert parameters["limit"]["default"] == 10
+
+
+def test_query_alias(api, client):
+    @api.get("/page")
+    def page(page_size: int = Field(20, gt=0, alias="page-size")) -> Item:
+        return Item(name="page", count=page_size)
+
+    assert client.get("/page?page-size=5").json["count"] == 5
+    assert client.get("/page").json["count"] == 20
+
+    response = client.get("/page?page-size=0")
+
+    assert response.status_code == 400
+    assert response.json["errors"][0]["loc"] == ["page-size"]
+
+    parameters = api.openapi()["paths"]["/page"]["get"]["parameters"]
+
+    assert parameters[-1]["name"] == "page-size"
+
+
+def test_negotiation_is_memoised(api, client):
+    for _ in range(3):
+        response = client.get(
+            "/items/1", headers={"Accept": "text/html;q=0.9, application/x-yaml"}
+        )
+
+        assert response.content_type == "application/x-yaml"
+
+    assert api.accept_cache.misses == 1
+    assert api.accept_cache.hits == 2
+
+    response = client.post(
+        "/items",
+        data=b'{"name": "nut"}',
+        content_type="application/json; charset=utf-8",
+    )
+
+    assert response.status_code == 201
+
+    response = client.post("/items", data=b"name: nut", content_type="text/plain")
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("endpoint", ["catalog", "shared"])
+def test_response_cache(api, client, endpoint):
+    for _ in range(3):
+        response = client.get("/%s/4" % endpoint)
+
+        assert response.json["count"] == 4
+
+    assert api.calls[endpoint] == 1
+
+    client.get("/%s/4" % endpoint, headers={"Accept": "application/x-yaml"})
+    client.get("/%s/5" % endpoint)
+
+    assert api.calls[endpoint] == 3
+
+    with api.app_context():
+        api.invalidate_cache(endpoint, item_id=4)
+
+    client.get("/%s/4" % endpoint)
+    client.get("/%s/5" % endpoint)
+
+    assert api.calls[endpoint] == 4
+
+    with api.app_context():
+        api.invalidate_cache(endpoint)
+
+    client.get("/%s/5" % endpoint)
+
+    assert api.calls[endpoint] == 5
+
+    with pytest.raises(AssertionError, match="can be cached"):
+
+        @api.post("/%s" % endpoint, cache=ResponseCache(ttl=60))
+        def post_cached(body: Item) -> Item:
+            return body
+
+
+@pytest.mark.parametrize("name", ["memory", "sqlite"])
+def test_response_cache_shared_by_endpoints(tmp_path, name):
+    backend = None
+
+    if name == "sqlite":
+        backend = SQLiteCacheBackend(str(tmp_path / "cache.db"))
+
+    api = FlaskFastAPI(__name__, "Test API", "1.0.0")
+    client = api.test_client()
+    cache = ResponseCache(ttl=60, backend=backend)
+    calls = Counter()
+
+    @api.get("/a/<int:item_id>", cache=cache)
+    def a(item_id: int) -> Item:
+        calls["a"] += 1
+
+        return Item(name="a", count=item_id)
+
+    @api.get("/a_b/<int:item_id>", cache=cache)
+    def a_b(item_id: int) -> Item:
+        calls["a_b"] += 1
+
+        return Item(name="a_b", count=item_id)
+
+    for _ in range(2):
+        client.get("/a/1")
+        client.get("/a_b/1")
+
+    with api.app_context():
+        api.invalidate_cache("a")
+
+    client.get("/a/1")
+    client.get("/a_b/1")
+
+    assert calls == {"a": 2, "a_b": 1}
+
+
+def test_response_cache_expiry():
+    from flask_fastapi.cache import CachedResponse, MemoryCacheBackend
+
+    backend = MemoryCacheBackend(max_entries=2)
+    entry = CachedResponse(200, "application/json", b"{}")
+
+    backend.set("a", entry, 60)
+    backend.set("b", entry, -1)
+
+    assert backend.get("a") == entry
+    assert backend.get("b") is None
+
+    backend.set("c", entry, 60)
+    backend.set("d", entry, 60)
+
+    assert backend.get("a") is None
+
+
+@pytest.mark.parametrize("name", ["memory", "sqlite"])
+def test_response_cache_variants(tmp_path, name):
+    from flask_fastapi.cache import CachedResponse, MemoryCacheBackend
+
+    if name == "memory":
+        backend = MemoryCacheBackend()
+
+    else:
+        backend = SQLiteCacheBackend(str(tmp_path / "cache.db"))
+
+    cache = ResponseCache(ttl=60, backend=backend)
+    entry = CachedResponse(200, "application/json", b"{}")
+    keys = [
+        cache.make_key("get_item", "application/json", {"item_id": 1}),
+        cache.make_key(
+            "get_item", "application/json", {"item_id": 1}, {"fields": "id"}
+        ),
+        cache.make_key(
+            "get_item", "application/json", {"item_id": 2}, {"fields": "id"}
+        ),
+    ]
+
+    for key in keys:
+        cache.set(key, entry)
+
+    cache.invalidate("get_item", "application/json", {"item_id": 1})
+
+    assert [cache.get(key) for key in keys] == [None, None, entry]
+
+
+def test_conditional_get(api, client):
+    response = client.get("/tagged/1")
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+
+    response = client.get("/tagged/1", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/tagged/2", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert "ETag" not in client.get("/items/1").headers
+
+    response = client.head("/tagged/1")
+
+    assert response.status_code == 200
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.head("/tagged/1", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+
+    response = client.head("/items/1")
+
+    assert response.status_code == 200
+    assert int(response.headers["Content-Length"]) > 0
+
+
+def test_conditional_get_version(api, client):
+    response = client.get("/versioned/3")
+
+    assert response.headers["ETag"] == '"v3"'
+    assert api.calls["versioned"] == 1
+
+    response = client.get("/versioned/3", headers={"If-None-Match": '"v3"'})
+
+    assert response.status_code == 304
+    assert api.calls["versioned"] == 1
+
+    response = client.get(
+        "/versioned/3",
+        headers={"If-Modified-Since": "Thu, 04 Jan 2024 00:00:00 GMT"},
+    )
+
+    assert response.status_code == 304
+
+    response = client.get(
+        "/versioned/3",
+        headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"},
+    )
+
+    assert response.status_code == 200
+    assert api.calls["versioned"] == 2
+
+
+def test_compression(api, client):
+    from flask_fastapi import Compression
+
+    import gzip
+
+    api.compression = Compression(min_size=10, encodings=["gzip"])
+
+    response = client.get("/items/1", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == b'{"name":"widget-1","count":1}'
+
+    response = client.get("/items/1", headers={"Accept-Encoding": "br"})
+
+    assert "Content-Encoding" not in response.headers
+
+    response = client.get(
+        "/export?count=500", headers={"Accept-Encoding": "gzip;q=1.0, *;q=0"}
+    )
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(orjson.loads(gzip.decompress(response.data))) == 500
+
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    etag = response.headers["ETag"]
+
+    assert etag.endswith('-gzip"')
+    assert gzip.decompress(response.data) == client.get("/openapi.json").data
+
+    response = client.get(
+        "/openapi.json", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+
+    response = client.get("/docs/", headers={"Accept-Encoding": "gzip"})
+
+    assert b"swagger-ui" in gzip.decompress(response.data)
+
+
+def lambda_event(name):
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "lambda", name)) as f:
+        return orjson.loads(f.read())
+
+
+def test_lambda_apigw_v1(api):
+    result = api.lambda_handler(lambda_event("apigw_v1.json"), None)
+
+    assert result["statusCode"] == 200
+    assert not result["isBase64Encoded"]
+    assert orjson.loads(result["body"]) == {"name": "bolt-3", "count": 7}
+    assert result["multiValueHeaders"]["Content-Type"] == ["application/json"]
+
+
+def test_lambda_apigw_v2_binary(api):
+    import msgpack
+
+    result = api.lambda_handler(lambda_event("apigw_v2.json"), None)
+
+    assert result["statusCode"] == 201
+    assert result["isBase64Encoded"]
+    assert result["headers"]["Content-Type"] == "application/msgpack"
+    assert msgpack.unpackb(base64.b64decode(result["body"])) == {
+        "name": "cog",
+        "count": 3,
+    }
+
+
+def test_lambda_alb(api):
+    result = api.lambda_handler(lambda_event("alb.json"), None)
+
+    assert result["statusCode"] == 200
+    assert result["statusDescription"] == "200 OK"
+    assert orjson.loads(result["body"]) == {"items": [{"name": "a bx", "count": 0}]}
+
+    event = lambda_event("alb.json")
+    event["path"] = "/missing"
+
+    assert api.lambda_handler(event, None)["statusCode"] == 404
+
+
+def test_metrics(api, client):
+    observed = []
+
+    api.add_metrics_route()
+    api.register_metrics_hook(lambda *args: observed.append(args))
+    api.server_timing = True
+
+    response = client.post("/items", json={"name": "widget"})
+
+    phases = [
+        part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")
+    ]
+
+    assert phases == ["decode", "handler", "serialize", "total"]
+
+    assert client.get("/items/3?count=x").status_code == 400
+    assert observed[-1][:2] == ("get_item", 400)
+    assert "validate" in observed[-1][2]
+
+    text = client.get("/metrics").get_data(as_text=True)
+
+    assert 'requests_total{endpoint="create_item",status="201"} 1' in text
+    assert 'request_duration_seconds_count{endpoint="get_item",phase="total"} 1' in text
+    assert "/metrics" not in client.get("/openapi.json").json["paths"]
+
+
+def test_profiler(api, client):
+    from flask_fastapi import Profiler
+
+    @api.get("/slow")
+    def slow(delay: float) -> Item:
+        time.sleep(delay)
+
+        return Item(name="slow")
+
+    api.profiler = Profiler(threshold=0.05, interval=0.01)
+    api.add_profiles_route()
+
+    client.get("/slow?delay=0")
+    client.get("/slow?delay=0.1")
+
+    api.profiler.sample_rate = 1
+    client.get("/items/3")
+
+    profiles = client.get("/_profiles").json
+
+    assert [(p["endpoint"], p["kind"]) for p in profiles] == [
+        ("slow", "stack"),
+        ("get_item", "cprofile"),
+    ]
+    assert "test_flask_fastapi.py:test_profiler.<locals>.slow" in profiles[0]["profile"]
+    assert profiles[0]["url"] == "/slow?delay=0.1"
+    assert profiles[0]["arguments"] == {"delay": "0.1"}
+    # validated, with the defaults filled in
+    assert profiles[1]["arguments"] == {
+        "item_id": "3",
+        "name": "'widget'",
+        "count": "1",
+    }
+    assert "/_profiles" not in client.get("/openapi.json").json["paths"]
+
+
+def test_exception_reporting(api, client):
+    from flask_fastapi import ExceptionDispatcher
+
+    reported = []
+    batches = []
+    paths = []
+
+    @api.get("/fail")
+    def fail(kind: int) -> Item:
+        if kind:
+            raise KeyError(kind)
+
+        raise ValueError(kind)
+
+    def slow_reporter(app, e):
+        time.sleep(0.2)
+        reported.append(e)
+        paths.append(request.full_path)
+
+    api.register_exception_reporter(slow_reporter)
+    api.register_exception_reporter(
+        lambda app, events: batches.append(events), batch=True
+    )
+    api.exception_dispatcher = dispatcher = ExceptionDispatcher(api, max_queue=2)
+
+    start = time.perf_counter()
+
+    for kind in (0, 1, 1, 1):
+        assert client.get("/fail?kind=%d" % kind).status_code == 500
+
+    assert time.perf_counter() - start < 0.2
+
+    # a third distinct exception doesn't fit in the queue
+    assert not dispatcher.submit(RuntimeError())
+    assert dispatcher.flush()
+
+    assert [type(e) for e in reported] == [ValueError, KeyError]
+    assert paths == ["/fail?kind=0", "/fail?kind=1"]
+    assert [(event.count, event.method, event.url) for event in batches[0]] == [
+        (1, "GET", "/fail?kind=0"),
+        (3, "GET", "/fail?kind=1"),
+    ]
+    assert dispatcher.stats() == {
+        "delivered": 2,
+        "dropped": 1,
+        "deduplicated": 2,
+        "queued": 0,
+    }
+
+
+def test_background_tasks(api, client):
+    from flask_fastapi import BackgroundTasks
+
+    done = []
+    reported = []
+
+    def audit(name):
+        time.sleep(0.1)
+        done.append(name)
+
+    @api.post("/audited")
+    def audited(body: Item, tasks: BackgroundTasks) -> Item:
+        tasks.add_task(audit, body.name)
+        tasks.add_task(done.remove, "missing")
+        tasks.add_task(done.append, "after")
+
+        if body.count < 0:
+            raise BadRequestException()
+
+        return body
+
+    api.register_exception_reporter(lambda app, e: reported.append(e))
+
+    for count, status in ((-1, 400), (0, 201)):
+        # the server closes the response once it has been sent
+        with client.post("/audited", json={"name": "b", "count": count}) as response:
+            assert response.status_code == status
+            assert done == []
+
+    assert api.background_executor.drain()
+    assert api.exception_dispatcher.flush()
+
+    # in order, and a failed task doesn't stop the rest
+    assert done == ["b", "after"]
+    assert [type(e) for e in reported] == [ValueError]
+
+    parameters = client.get("/openapi.json").json["paths"]["/audited"]["post"][
+        "parameters"
+    ]
+
+    assert "tasks" not in [parameter["name"] for parameter in parameters]
+
+
+def test_dependencies(api, client):
+    from flask_fastapi import Depends
+
+    events = []
+
+    def pool():
+        events.append("pool open")
+        yield "pool"
+        events.append("pool closed")
+
+    def connection(pool=Depends(pool, scope="app")):
+        events.append("connect")
+        yield pool + " connection"
+        events.append("disconnect")
+
+    def user(token: str, db=Depends(connection)):
+        events.append("user")
+
+        if token != "secret":
+            raise BadRequestException()
+
+        return "user from " + db
+
+    def permissions(user=Depends(user), db=Depends(connection)):
+        return [user, db]
+
+    @api.get("/me")
+    def me(user=Depends(user), permissions=Depends(permissions)) -> ItemList:
+        return ItemList(items=[Item(name=name) for name in [user, *permissions]])
+
+    def broken():
+        yield "broken"
+        raise RuntimeError("teardown failed")
+
+    @api.get("/broken")
+    def get_broken(db=Depends(connection), value=Depends(broken)) -> Item:
+        return Item(name=value)
+
+    for _ in range(2):
+        with client.get("/me?token=secret") as response:
+            assert [item["name"] for item in response.json["items"]] == [
+                "user from pool connection",
+                "user from pool connection",
+                "pool connection",
+            ]
+
+    with client.get("/me?token=wrong") as response:
+        assert response.status_code == 400
+
+    api.close_dependencies()
+
+    assert events == ["pool open"] + ["connect", "user", "disconnect"] * 3 + [
+        "pool closed"
+    ]
+
+    parameters = client.get("/openapi.json").json["paths"]["/me"]["get"]["parameters"]
+
+    assert {"name": "token", "in": "query", "required": True} == {
+        key: value
+        for key, value in parameters[-1].items()
+        if key in ("name", "in", "required")
+    }
+
+    # closing the response doesn't raise, and the rest are still torn down
+    with client.get("/broken") as response:
+        assert response.json["name"] == "broken"
+
+    assert events[-1] == "disconnect"
+
+
+def test_coalesce(api):
+    from concurrent.futures import ThreadPoolExecutor
+
+    @api.get("/hot/<int:item_id>", coalesce=True)
+    def hot(item_id: int) -> Item:
+        api.calls["hot"] += 1
+        time.sleep(0.2)
+
+        return Item(name="hot", count=item_id)
+
+    @api.get("/impatient", coalesce=0.01)
+    def impatient() -> Item:
+        api.calls["impatient"] += 1
+        time.sleep(0.1)
+
+        return Item(name="impatient")
+
+    def get(url):
+        return api.test_client().get(url).json
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(get, ["/hot/1"] * 6 + ["/hot/2"] * 2))
+        list(pool.map(get, ["/impatient"] * 4))
+
+    assert (
+        results == [{"name": "hot", "count": 1}] * 6 + [{"name": "hot", "count": 2}] * 2
+    )
+    assert api.calls["hot"] == 2
+    assert api.calls["impatient"] == 4
+    assert api.single_flight.coalesced >= 6
+
+    # nothing is kept once the flight lands
+    get("/hot/1")
+
+    assert api.calls["hot"] == 3
+
+    # requests with a body can't share a response
+    with pytest.raises(AssertionError, match="can be coalesced"):
+
+        @api.post("/hot", coalesce=True)
+        def post_hot(body: Item) -> Item:
+            return body
+
+
+def test_concurrency_limit(api):
+    from concurrent.futures import ThreadPoolExecutor
+
+    api.queue_timeout = 0.3
+
+    @api.get("/busy", max_concurrency=1, max_queue=1)
+    def busy() -> Item:
+        time.sleep(0.2)
+
+        return Item(name="busy")
+
+    def get(_):
+        response = api.test_client().get("/busy")
+
+        return response.status_code, response.headers.get("Retry-After")
+
+    with ThreadPoolExecutor(3) as pool:
+        results = sorted(pool.map(get, range(3)))
+
+    # one runs, one waits its turn and the third is turned away
+    assert results == [(200, None), (200, None), (503, "1")]
+    assert api.concurrency_stats()["busy"] == {
+        "max_concurrency": 1,
+        "max_queue": 1,
+        "active": 0,
+        "queued": 0,
+        "admitted": 2,
+        "rejected": 1,
+        "timed_out": 0,
+    }
+
+
+def test_async_handlers(api, client):
+    import asyncio
+    from flask_fastapi import BackgroundTasks, Depends
+
+    loops = set()
+    events = []
+
+    async def backend():
+        loops.add(asyncio.get_running_loop())
+        events.append("open")
+        yield "backend"
+        events.append("close")
+
+    async def fetch(name, delay):
+        await asyncio.sleep(delay)
+
+        return Item(name=name)
+
+    async def record(name):
+        await asyncio.sleep(0)
+        events.append(name)
+
+    @api.get("/aggregate")
+    async def aggregate(
+        count: int, tasks: BackgroundTasks, backend=Depends(backend)
+    ) -> ItemList:
+        loops.add(asyncio.get_running_loop())
+        tasks.add_task(record, request.args["count"])
+
+        items = await asyncio.gather(
+            *(fetch("%s %d" % (backend, i), 0.1) for i in range(count))
+        )
+
+        return ItemList(items=items)
+
+    start = time.perf_counter()
+
+    for _ in range(2):
+        with client.get("/aggregate?count=5") as response:
+            assert [item["name"] for item in response.json["items"]] == [
+                "backend %d" % i for i in range(5)
+            ]
+
+    assert time.perf_counter() - start < 0.4
+
+    assert client.get("/aggregate?count=x").status_code == 400
+    assert api.background_executor.drain()
+    assert len(loops) == 1
+    # background tasks finish after their response is closed
+    assert sorted(events) == sorted(["open", "close", "5"] * 2)
+
+
+def test_sparse_fields(api, client):
+    class Owner(BaseModel):
+        name: str
+        email: str
+
+    class Order(BaseModel):
+        id: int
+        owner: Owner
+        items: List[Item]
+        notes: Optional[str] = None
+
+    @api.get("/orders/<int:order_id>", fields=True, cache=ResponseCache(ttl=60))
+    def get_order(order_id: int) -> Order:
+        api.calls["orders"] += 1
+
+        return Order(
+            id=order_id,
+            owner=Owner(name="ann", email="ann@example.com"),
+            items=[Item(name="a", count=1), Item(name="b", count=2)],
+        )
+
+    assert client.get("/orders/1?fields=id,owner.name,items.count").json == {
+        "id": 1,
+        "owner": {"name": "ann"},
+        "items": [{"count": 1}, {"count": 2}],
+    }
+    assert client.get("/orders/1?fields=items,items.name").json == {
+        "items": [{"name": "a", "count": 1}, {"name": "b", "count": 2}],
+    }
+    assert len(client.get("/orders/1").json) == 4
+    assert api.calls["orders"] == 3
+
+    client.get("/orders/1?fields=id")
+    client.get("/orders/2?fields=id")
+
+    assert api.calls["orders"] == 5
+
+    with api.app_context():
+        # every selection for the arguments goes
+        api.invalidate_cache("get_order", order_id=1)
+
+    client.get("/orders/1?fields=id")
+    client.get("/orders/1?fields=items,items.name")
+    client.get("/orders/2?fields=id")
+
+    assert api.calls["orders"] == 7
+
+    response = client.get("/orders/1?fields=owner.phone")
+
+    assert response.status_code == 400
+
+    response = client.get(
+        "/orders/1?fields=owner.name", headers={"Accept": "application/x-yaml"}
+    )
+
+    assert response.data == b"owner:\n  name: ann\n"
+
+    parameters = client.get("/openapi.json").json["paths"]["/orders/{order_id}"]["get"][
+        "parameters"
+    ]
+
+    assert parameters[-1]["name"] == "fields"
+
+
+def test_authentication(api, client):
+    from flask_fastapi import Authenticated, Depends
+
+    verified = Counter()
+
+    def verify_jwt(token):
+        verified[token] += 1
+
+        if token == "expiring":
+            return Authenticated("carol", expires=time.time() + 0.1)
+
+        if token == "expired":
+            return Authenticated("dave", expires=time.time() - 1)
+
+        return "alice" if token == "good" else None
+
+    def verify_api_key(key):
+        verified[key] += 1
+
+        return "service" if key == "key" else None
+
+    def caller(principal):
+        return "caller %s" % principal
+
+    api.register_authenticator("bearerAuth", verify_jwt)
+    api.register_authenticator("apiKeyAuth", verify_api_key)
+
+    @api.get("/whoami")
+    def whoami(principal, caller=Depends(caller)) -> Item:
+        return Item(name="%s, %s" % (principal, caller))
+
+    def get(headers):
+        return client.get("/whoami", headers=headers)
+
+    response = get({})
+
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == ('Bearer, ApiKey header="X-API-Key"')
+    assert client.get("/items/1").status_code == 401
+    assert client.get("/openapi.json").status_code == 200
+
+    for _ in range(2):
+        assert get({"Authorization": "Bearer good"}).json["name"] == (
+            "alice, caller alice"
+        )
+        assert get({"Authorization": "Bearer bad"}).status_code == 401
+
+    assert get({"X-API-Key": "key"}).json["name"] == "service, caller service"
+    assert verified == {"good": 1, "bad": 1, "key": 1}
+
+    # not cached beyond the credential's own expiry
+    assert get({"Authorization": "Bearer expiring"}).status_code == 200
+    time.sleep(0.15)
+    assert get({"Authorization": "Bearer expiring"}).status_code == 200
+    assert verified["expiring"] == 2
+
+    for _ in range(2):
+        assert get({"Authorization": "Bearer expired"}).status_code == 401
+
+    assert verified["expired"] == 1
+
+    parameters = client.get("/openapi.json").json["paths"]["/whoami"]["get"][
+        "parameters"
+    ]
+
+    assert "principal" not in [parameter["name"] for parameter in parameters]
+
+
+def test_import_is_lazy():
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import flask_fastapi\n"
+        "print(time.perf_counter() - start)\n"
+        "print(','.join(m for m in ('yaml', 'msgpack', 'cbor2', 'sqlite3')"
+        " if m in sys.modules))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, check=True, text=True
+    )
+    import_time, loaded = result.stdout.splitlines()
+
+    # generous, flask and pydantic account for most of it
+    assert float(import_time) < 2.0
+    assert loaded == ""
+
+
+def test_openapi_snapshot(api, tmp_path, monkeypatch):
+    path = tmp_path / "openapi.json"
+
+    result = api.test_cli_runner().invoke(
+        args=["openapi", "export", "--output", str(path)]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert path.read_bytes() == api.export_openapi()
+
+    snapshot_api = FlaskFastAPI(
+        __name__, "Test API", "1.0.0", openapi_snapshot=str(path)
+    )
+
+    def build():
+        raise AssertionError("the snapshot should be used")
+
+    monkeypatch.setattr(snapshot_api, "_build_openapi", build)
+
+    start = time.perf_counter()
+    response = snapshot_api.test_client().get("/openapi.json")
+
+    # served from the snapshot, without building the document
+    assert time.perf_counter() - start < 1.0
+    assert response.status_code == 200
+    assert "/items/{item_id}" in response.json["paths"]
+
+
+def test_per_process(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from flask_fastapi.utils import PerProcess
+
+    started = []
+
+    def start():
+        time.sleep(0.05)
+        started.append(os.getpid())
+
+    process = PerProcess(start)
+
+    assert not process.started
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: process.ensure(), range(8)))
+
+    assert process.started
+    assert len(started) == 1
+
+    # as seen from a forked child
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+
+    assert not process.started
+
+    process.ensure()
+
+    assert started == [started[0], -1]
+
+
+def test_warmup(api, client, monkeypatch):
+    try:
+        report = api.warmup(freeze=True)
+
+    finally:
+        gc.unfreeze()
+
+    assert report.endpoints == len(
+        [view for view in api.view_functions.values() if hasattr(view, "bindings")]
+    )
+    assert report.frozen_objects > 0
+    assert report.seconds > 0
+    assert report.rss_before > 0
+    assert report.rss_after > 0
+    assert report.rss_growth == report.rss_after - report.rss_before
+    assert "yaml" in sys.modules
+
+    def build():
+        raise AssertionError("warmup should have built the document")
+
+    monkeypatch.setattr(api, "_build_openapi", build)
+
+    assert client.get("/openapi.json").status_code == 200
+    assert client.get("/docs/").status_code == 200